@@ -1,23 +1,30 @@
 #!/usr/bin/env python3
 import random
-from utils import settings
-from gtts import gTTS
+from gtts import gTTS, gTTSError
+from utils.ratelimit import limited
 
 max_chars = 0
 
 
+def is_throttled(error: Exception) -> bool:
+    """Whether Google turned the request down because of the request rate"""
+    return isinstance(error, gTTSError) and getattr(error.rsp, "status_code", None) in (429, 503)
+
+
 class GTTS:
     def __init__(self):
         self.max_chars = 5000
+        self.max_concurrency = 4
         self.voices = []
+        self.lang = ""  # set by TTSEngine to the language of the rendition
 
     def run(self, text, filepath):
         tts = gTTS(
             text=text,
-            lang=settings.config["reddit"]["thread"]["post_lang"] or "en",
+            lang=self.lang or "en",
             slow=False,
         )
-        tts.save(filepath)
+        limited("GTTS", lambda: tts.save(filepath), should_retry=is_throttled)
 
     def randomvoice(self):
         return random.choice(self.voices)
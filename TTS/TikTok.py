@@ -1,8 +1,8 @@
 import base64
 from utils import settings
 import random
-import requests
-from requests.adapters import HTTPAdapter, Retry
+from utils.sessions import pooled_session
+from utils.ratelimit import limited
 
 # from profanity_filter import ProfanityFilter
 # pf = ProfanityFilter()
@@ -61,7 +61,9 @@ class TikTok:  # TikTok Text-to-Speech Wrapper
             "https://api16-normal-useast5.us.tiktokv.com/media/api/text/speech/invoke/?text_speaker="
         )
         self.max_chars = 300
+        self.max_concurrency = 4
         self.voices = {"human": human, "nonhuman": nonhuman, "noneng": noneng}
+        self.session = pooled_session(self.max_concurrency)
 
     def run(self, text, filepath, random_voice: bool = False):
         # if censor:
@@ -70,16 +72,11 @@ class TikTok:  # TikTok Text-to-Speech Wrapper
         voice = (
             self.randomvoice()
         )
-        try:
-            r = requests.post(f"{self.URI_BASE}{voice}&req_text={text}&speaker_map_type=0")
-        except requests.exceptions.SSLError:
-            # https://stackoverflow.com/a/47475019/18516611
-            session = requests.Session()
-            retry = Retry(connect=3, backoff_factor=0.5)
-            adapter = HTTPAdapter(max_retries=retry)
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-            r = session.post(f"{self.URI_BASE}{voice}&req_text={text}&speaker_map_type=0")
+        # SSL errors and rate limits are retried with backoff by the rate limiter
+        r = limited(
+            "TikTok",
+            lambda: self.session.post(f"{self.URI_BASE}{voice}&req_text={text}&speaker_map_type=0"),
+        )
         # print(r.text)
         with open(filepath + " " + voice +  ".json", "w+") as f:
             f.write(r.text)
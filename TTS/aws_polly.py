@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
+import threading
+
 from boto3 import Session
-from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, HTTPClientError, ProfileNotFound
+from botocore.exceptions import ConnectionError as BotoConnectionError
 import sys
 from utils import settings
 import random
+from utils.ratelimit import limited
 
 voices = [
     "Brian",
@@ -24,15 +29,33 @@ voices = [
 ]
 
 
+def is_throttled(error: Exception) -> bool:
+    """Whether Polly turned the request down because of the request rate"""
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"] in ("ThrottlingException", "ServiceFailureException")
+    return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+
 class AWSPolly:
     def __init__(self):
         self.max_chars = 3000
+        self.max_concurrency = 8
         self.voices = voices
+        self.polly = None
+        self.lock = threading.Lock()
+
+    def client(self):
+        """The Polly client shared by every request, created on first use"""
+        with self.lock:
+            if self.polly is None:
+                pool_size = settings.config["settings"]["tts"]["http_pool_size"]
+                config = Config(max_pool_connections=int(pool_size or self.max_concurrency))
+                self.polly = Session(profile_name="polly").client("polly", config=config)
+            return self.polly
 
     def run(self, text, filepath, random_voice: bool = False):
         try:
-            session = Session(profile_name="polly")
-            polly = session.client("polly")
+            polly = self.client()
             if random_voice:
                 voice = self.randomvoice()
             else:
@@ -43,8 +66,12 @@ class AWSPolly:
                 voice = str(settings.config["settings"]["tts"]["aws_polly_voice"]).capitalize()
             try:
                 # Request speech synthesis
-                response = polly.synthesize_speech(
-                    Text=text, OutputFormat="mp3", VoiceId=voice, Engine="neural"
+                response = limited(
+                    "AWSPolly",
+                    lambda: polly.synthesize_speech(
+                        Text=text, OutputFormat="mp3", VoiceId=voice, Engine="neural"
+                    ),
+                    should_retry=is_throttled,
                 )
             except (BotoCoreError, ClientError) as error:
                 # The service returned an error, exit gracefully
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils.console import print_substep
+from utils.shared import file_lock, read_json, temp_path, write_json
+
+
+class TTSCache:
+    """Content-addressed store of synthesized clips, shared by every run.
+
+    Clips are keyed by a hash of the provider, voice, language and sanitized text, and the least
+    recently used ones are evicted once the cache grows past max_size bytes.
+
+    Args:
+        max_size (int): Maximum size of the cached clips in bytes
+        path (Optional): Folder the clips and their index are kept in
+    """
+
+    def __init__(self, max_size: int, path: str = "assets/tts_cache"):
+        self.max_size = max_size
+        self.path = path
+        self.index_file = f"{path}/index.json"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.removed = set()  # keys evicted here, dropped from the index file on the next save
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.index = read_json(self.index_file)
+
+    @staticmethod
+    def key(provider: str, voice: str, lang: str, text: str) -> str:
+        return hashlib.sha256("\0".join([provider, voice, lang, text]).encode()).hexdigest()
+
+    def fetch(self, key: str, filepath: str) -> Optional[float]:
+        """Places the cached clip at filepath.
+
+        Returns:
+            Optional[float]: Length of the clip, None if it isn't cached
+        """
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None or not Path(f"{self.path}/{key}.mp3").is_file():
+                self.index.pop(key, None)
+                self.removed.add(key)
+                self.misses += 1
+                return None
+            entry["used"] = time.time()
+            self.hits += 1
+        try:
+            _link(f"{self.path}/{key}.mp3", filepath)
+        except FileNotFoundError:  # another job evicted it since the check
+            with self.lock:
+                self.index.pop(key, None)
+                self.removed.add(key)
+                self.hits -= 1
+                self.misses += 1
+            return None
+        return entry["length"]
+
+    def store(self, key: str, filepath: str, length: float):
+        """Adds a freshly synthesized clip to the cache, evicting old clips if it grows too big."""
+        with self.lock:
+            if key in self.index and Path(f"{self.path}/{key}.mp3").is_file():
+                self.index[key]["used"] = time.time()  # stored by a worker with the same text
+                return
+        # copied rather than linked so a later write to filepath can't corrupt the cache, to a
+        # temp file of its own so workers storing the same text at once don't trip over each other
+        temp = temp_path(f"{self.path}/{key}.mp3")
+        shutil.copyfile(filepath, temp)
+        os.replace(temp, f"{self.path}/{key}.mp3")
+        with self.lock:
+            self.index[key] = {
+                "size": os.path.getsize(f"{self.path}/{key}.mp3"),
+                "length": length,
+                "used": time.time(),
+            }
+            self.save()
+
+    def evict(self):
+        size = sum(entry["size"] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]["used"]):
+            if size <= self.max_size:
+                break
+            size -= self.index.pop(key)["size"]
+            self.removed.add(key)
+            Path(f"{self.path}/{key}.mp3").unlink(missing_ok=True)
+
+    def save(self):
+        """Merges the index with the one other processes saved, evicts and writes it back.
+
+        Clips stored by any process stay in the index, so they are evicted like the others.
+        """
+        with file_lock(self.index_file):
+            index = read_json(self.index_file)
+            for key in self.removed:
+                index.pop(key, None)
+            for key, entry in self.index.items():
+                if key not in index or entry["used"] > index[key]["used"]:
+                    index[key] = entry
+            self.index = index
+            self.evict()
+            write_json(self.index_file, self.index)
+            self.removed.clear()
+
+    def report(self):
+        with self.lock:
+            self.save()
+        print_substep(f"TTS cache: {self.hits} hits, {self.misses} misses", style="bold blue")
+
+
+def _link(src: str, dst: str):
+    """Hard-links src to dst, copying it where hard links aren't possible"""
+    Path(dst).unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
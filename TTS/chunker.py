@@ -0,0 +1,78 @@
+import re
+import timeit
+from typing import List
+
+SENTENCE_ENDS = ".!?"
+CLAUSE_ENDS = ",;:"
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Splits text into chunks of at most max_chars characters for the TTS modules.
+
+    Chunks end at the last sentence boundary that fits, falling back to the last clause boundary,
+    then the last space, and only cuts a word apart if there is none. Every chunk is found with a
+    single backwards scan of the window in front of it, so the time is linear in the text length.
+
+    Args:
+        text (str): Text to split
+        max_chars (int): Maximum length of a chunk
+
+    Returns:
+        List[str]: The stripped, non-empty chunks in order
+    """
+    chunks = []
+    start = 0
+    while True:
+        while start < len(text) and text[start].isspace():
+            start += 1
+        if len(text) - start <= max_chars:
+            if start < len(text):
+                chunks.append(text[start:].rstrip())
+            return chunks
+        end = _boundary(text, start, start + max_chars)
+        chunks.append(text[start:end].rstrip())
+        start = end
+
+
+def _boundary(text: str, start: int, end: int) -> int:
+    """Finds where to end the chunk text[start:end], the chunk includes the punctuation"""
+    clause = space = None
+    for i in range(end - 1, start, -1):
+        char = text[i]
+        if char.isspace():
+            space = space or i
+        elif (char in SENTENCE_ENDS or char in CLAUSE_ENDS) and (
+            i + 1 == len(text) or text[i + 1].isspace()
+        ):
+            if char in SENTENCE_ENDS:
+                return i + 1
+            clause = clause or i + 1
+    return clause or space or end
+
+
+def _regex_split(text: str, max_chars: int) -> List[str]:
+    """The regex split_post used before, kept for the benchmark"""
+    return [
+        x.group().strip()
+        for x in re.finditer(r" *(((.|\n){0," + str(max_chars) + r"})(\.|.$))", text)
+    ]
+
+
+if __name__ == "__main__":
+    # Times split_text against the old regex, which backtracks on text without periods
+    cases = {
+        "normal text": (
+            "I worked at a pizza place for three years. One night a guy ordered forty pizzas. " * 80,
+            300,
+        ),
+        "no periods": ("word " * 2000, 5000),
+        "one long paragraph": (("and then it happened again " * 400) + ".", 5000),
+        "newlines, no periods": ("a line of text\n" * 700, 5000),
+    }
+    for name, (text, max_chars) in cases.items():
+        regex = timeit.timeit(lambda: _regex_split(text, max_chars), number=3) / 3
+        linear = timeit.timeit(lambda: split_text(text, max_chars), number=3) / 3
+        print(
+            f"{name:<22} {len(text):>6} chars  regex {regex * 1000:9.2f} ms  "
+            f"split_text {linear * 1000:7.2f} ms"
+        )
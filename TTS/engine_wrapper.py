@@ -1,19 +1,35 @@
 #!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, List, Optional, Tuple
 import re
+import time
 
 # import sox
 # from mutagen import MutagenError
 # from mutagen.mp3 import MP3, HeaderNotFoundError
-import translators as ts
 from rich.progress import track
+from TTS.cache import TTSCache
+from TTS.chunker import split_text
+from TTS.planner import record_rate
 from moviepy.editor import AudioFileClip, CompositeAudioClip, concatenate_audioclips
+from utils.audio import concat_mp3, get_duration, save_manifest
 from utils.console import print_step, print_substep
+from utils.translate import get_languages, translate_text
 from utils.voice import sanitize_text
-from utils import settings
+from utils.workdir import job_dir
+from utils import ratelimit, settings
 
 DEFAULT_MAX_LENGTH: int = 50  # video length variable
+DEFAULT_CACHE_SIZE: int = 500  # MB, used when the config has no cache_size
+
+# config key of the voice each TTS module reads, part of the TTS cache key
+VOICE_SETTINGS = {
+    "AWSPolly": "aws_polly_voice",
+    "StreamlabsPolly": "streamlabs_polly_voice",
+    "TikTok": "tiktok_voice",
+    "pyttsx": "python_voice",
+}
 
 
 class TTSEngine:
@@ -23,8 +39,9 @@ class TTSEngine:
     Args:
         tts_module          : The TTS module. Your module should handle the TTS itself and saving to the given path under the run method.
         reddit_object         : The reddit object that contains the posts to read.
-        path (Optional)       : The unix style path to save the mp3 files to. This must not have leading or trailing slashes.
+        path (Optional)       : The unix style path to save the mp3 files to, with a trailing slash. Defaults to the job directory.
         max_length (Optional) : The maximum length of the mp3 files in total.
+        lang (Optional)       : Language to read the posts in, the files go to a folder of that name. Defaults to post_lang.
 
     Notes:
         tts_module must take the arguments text and filepath.
@@ -34,18 +51,28 @@ class TTSEngine:
         self,
         tts_module,
         reddit_object: dict,
-        path: str = "assets/temp/",
+        path: str = None,
         max_length: int = DEFAULT_MAX_LENGTH,
         last_clip_length: int = 0,
+        lang: str = None,
     ):
-        self.racked_up_split_length = 0
         self.tts_module = tts_module()
         self.reddit_object = reddit_object
         self.redditid = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
-        self.path = path + self.redditid + "/mp3"
+        self.lang = lang
+        # the language of this rendition, for TTS modules that speak more than one
+        self.tts_module.lang = get_languages()[0] if lang is None else lang
+        base = path + self.redditid if path else job_dir(self.redditid)
+        self.path = base + (f"/{lang}" if lang else "") + "/mp3"
         self.max_length = max_length
         self.length = 0
+        self.lengths = {}
+        self.samples = []
         self.last_clip_length = last_clip_length
+        cache_size = settings.config["settings"]["tts"]["cache_size"]
+        if cache_size in ({}, "", None):  # missing from the config, an explicit 0 turns it off
+            cache_size = DEFAULT_CACHE_SIZE
+        self.cache = TTSCache(int(cache_size) * 1024 * 1024) if int(cache_size) else None
 
     def run(self) -> Tuple[int, int]:
 
@@ -59,88 +86,202 @@ class TTSEngine:
 
         print_step("Saving Text to MP3 files...")
 
-        self.call_tts("title", process_text(self.reddit_object["thread_title"]))
-        processed_text = process_text(self.reddit_object["thread_post"])
+        self.length += self.call_tts(
+            "title", process_text(self.reddit_object["thread_title"], self.lang)
+        )
+        processed_text = process_text(self.reddit_object["thread_post"], self.lang)
         if processed_text != "" and settings.config["settings"]["storymode"] == True:
-            self.call_tts("posttext", processed_text)
-
-        idx = None
-        for idx, comment in track(enumerate(self.reddit_object["comments"]), "Saving..."):
-            # ! Stop creating mp3 files if the length is greater than max length.
-            if self.length > self.max_length:
-                self.length -= self.last_clip_length
-                idx -= 1
+            self.length += self.call_tts("posttext", processed_text)
+
+        comments = self.reddit_object["comments"]
+        if hasattr(self.tts_module, "run_batch"):
+            clip_lengths = self.synthesize_batch(comments)
+        else:
+            clip_lengths = self.synthesize_concurrently(comments)
+        number_of_comments = 0
+        for idx, clip_length in enumerate(track(clip_lengths, "Saving...", total=len(comments))):
+            self.last_clip_length = clip_length
+            # ! Stop adding comments once the next one makes the audio longer than max length.
+            if self.length + self.last_clip_length > self.max_length:
                 break
-            if (
-                len(comment["comment_body"]) > self.tts_module.max_chars
-            ):  # Split the comment if it is too long
-                self.split_post(comment["comment_body"], idx)  # Split the comment
-            else:  # If the comment is not too long, just call the tts engine
-                self.call_tts(f"{idx}", process_text(comment["comment_body"]))
+            self.length += self.last_clip_length
+            number_of_comments = idx + 1
+        clip_lengths.close()  # waits for the comments still being synthesized
+        if hasattr(self.tts_module, "close"):
+            self.tts_module.close()
 
+        save_manifest(self.path, self.lengths)
+        record_rate(type(self.tts_module).__name__, self.voice(), self.samples)
+        if self.cache is not None:
+            self.cache.report()
+        ratelimit.report(type(self.tts_module).__name__)
         print_substep("Saved Text to MP3 files successfully.", style="bold green")
-        return self.length, idx
-
-    def split_post(self, text: str, idx: int):
-        split_files = []
-        split_text = [
-            x.group().strip()
-            for x in re.finditer(
-                r" *(((.|\n){0," + str(self.tts_module.max_chars) + "})(\.|.$))", text
+        return self.length, number_of_comments
+
+    def concurrency(self) -> int:
+        """Number of comments synthesized at once, capped by what the TTS module allows"""
+        limit = getattr(self.tts_module, "max_concurrency", 1)
+        configured = settings.config["settings"]["tts"]["concurrency"]
+        return max(1, min(int(configured), limit) if configured else limit)
+
+    def synthesize_concurrently(self, comments: List[dict]) -> Iterator[float]:
+        """Synthesizes up to `concurrency` comments at once, yielding their lengths in order"""
+        workers = self.concurrency()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            try:
+                for idx in range(len(comments)):
+                    for ahead in range(idx, min(idx + workers, len(comments))):
+                        if ahead not in futures:
+                            futures[ahead] = pool.submit(
+                                self.synthesize_comment, ahead, comments[ahead]["comment_body"]
+                            )
+                    yield futures.pop(idx).result()
+            finally:  # the caller stopped early, don't synthesize the rest
+                for future in futures.values():
+                    future.cancel()
+
+    def synthesize_batch(self, comments: List[dict]) -> Iterator[float]:
+        """Synthesizes all comments with one run_batch call of the TTS module.
+
+        Comments in the TTS cache are skipped, and comments too long for the TTS module are split
+        and synthesized on their own.
+
+        Yields:
+            float: Length of the audio of every comment in order, 0 if the TTS module failed
+        """
+        jobs = {}
+        lengths = {}
+        for idx, comment in enumerate(comments):
+            text = translate_text(comment["comment_body"], self.lang)
+            if len(text) > self.tts_module.max_chars:
+                continue
+            text = sanitize_text(text)
+            length = self.from_cache(f"{idx}", text)
+            if length is None:
+                jobs[idx] = text
+                Path(f"{self.path}/{idx}.mp3").unlink(missing_ok=True)
+            else:
+                lengths[idx] = length
+        if jobs:
+            self.tts_module.run_batch(
+                [(text, f"{self.path}/{idx}.mp3") for idx, text in jobs.items()]
             )
-        ]
+        for idx, text in jobs.items():
+            lengths[idx] = self.saved(f"{idx}", text)
+        for idx, comment in enumerate(comments):
+            if idx not in lengths:  # too long, split it
+                lengths[idx] = self.synthesize_comment(idx, comment["comment_body"])
+            yield lengths[idx]
+
+    def synthesize_comment(self, idx: int, text: str) -> float:
+        """Saves one comment to {idx}.mp3, splitting it if it is too long for the TTS module.
+
+        Returns:
+            float: Length of the audio, 0 if the TTS module failed
+        """
+        # split the translation, it can be longer than the comment
+        text = translate_text(text, self.lang)
+        if len(text) > self.tts_module.max_chars:  # Split the comment if it is too long
+            return self.split_post(text, idx)
+        # If the comment is not too long, just call the tts engine
+        return self.call_tts(f"{idx}", sanitize_text(text))
+
+    def split_post(self, text: str, idx: int) -> float:
+        parts = []
+        length = 0
         offset = 0
-        for idy, text_cut in enumerate(split_text):
+        for idy, text_cut in enumerate(split_text(text, self.tts_module.max_chars)):
             # print(f"{idx}-{idy}: {text_cut}\n")
-            new_text = process_text(text_cut)
+            new_text = sanitize_text(text_cut)
             if not new_text or new_text.isspace():
                 offset += 1
                 continue
 
-            if not self.call_tts(f"{idx}-{idy - offset}.part", new_text, True):
+            part_length = self.call_tts(f"{idx}-{idy - offset}.part", new_text)
+            if not part_length:
                 # Failed for whatever reason, seems to happen with tiktok and split posts.
-                self.length -= self.racked_up_split_length
                 print("Failed")
-                return
-            split_files.append(AudioFileClip(f"{self.path}/{idx}-{idy - offset}.part.mp3"))
-        self.racked_up_split_length = 0
-        CompositeAudioClip([concatenate_audioclips(split_files)]).write_audiofile(
-            f"{self.path}/{idx}.mp3", fps=44100, verbose=False, logger=None
+                return 0
+            parts.append(f"{self.path}/{idx}-{idy - offset}.part.mp3")
+            length += part_length
+        Path(f"{self.path}/{idx}.mp3").unlink(missing_ok=True)  # could be linked into the cache
+
+        start = time.perf_counter()
+        if concat_mp3(parts, f"{self.path}/{idx}.mp3"):
+            joined = "without re-encoding"
+        else:  # the parts differ in format, decode them and encode them again
+            split_files = [AudioFileClip(part) for part in parts]
+            CompositeAudioClip([concatenate_audioclips(split_files)]).write_audiofile(
+                f"{self.path}/{idx}.mp3", fps=44100, verbose=False, logger=None
+            )
+            for clip in split_files:
+                clip.close()
+            joined = "by re-encoding"
+        print_substep(
+            f"Joined {len(parts)} parts of comment {idx} {joined} "
+            f"in {(time.perf_counter() - start) * 1000:.0f} ms"
         )
 
-        for i in split_files:
-            name = i.filename
-            i.close()
-            Path(name).unlink()
+        for part in parts:
+            Path(part).unlink()
+            self.lengths.pop(Path(part).stem, None)
+        self.lengths[f"{idx}"] = length
+        return length
 
-        # for i in range(0, idy + 1):
-        # print(f"Cleaning up {self.path}/{idx}-{i}.part.mp3")
+    def call_tts(self, filename: str, text: str) -> float:
+        """Saves the text to {filename}.mp3 with the TTS module, or takes it from the TTS cache.
 
-        # Path(f"{self.path}/{idx}-{i}.part.mp3").unlink()
+        Returns:
+            float: Length of the audio, 0 if the TTS module failed
+        """
+        length = self.from_cache(filename, text)
+        if length is not None:
+            return length
+        filepath = f"{self.path}/{filename}.mp3"
+        # an earlier run may have left a hard link into the cache here, don't write through it
+        Path(filepath).unlink(missing_ok=True)
+        self.tts_module.run(text, filepath=filepath)
+        return self.saved(filename, text)
 
-    def call_tts(self, filename: str, text: str, split=False):
-        self.tts_module.run(text, filepath=f"{self.path}/{filename}.mp3")
-        # try:
-        #     self.length += MP3(f"{self.path}/{filename}.mp3").info.length
-        # except (MutagenError, HeaderNotFoundError):
-        #     self.length += sox.file_info.duration(f"{self.path}/{filename}.mp3")
-        try:
-            clip = AudioFileClip(f"{self.path}/{filename}.mp3")
-            self.last_clip_length = clip.duration
-            self.length += clip.duration
-            if split:
-                self.racked_up_split_length += clip.duration
-            clip.close()
-            return True
-        except:
-            return False
-
-
-def process_text(text: str):
-    lang = settings.config["reddit"]["thread"]["post_lang"]
-    new_text = sanitize_text(text)
-    if lang:
-        print_substep("Translating Text...")
-        translated_text = ts.google(text, to_language=lang)
-        new_text = sanitize_text(translated_text)
-    return new_text
+    def cache_key(self, text: str) -> str:
+        return self.cache.key(
+            type(self.tts_module).__name__,
+            self.voice(),
+            get_languages()[0] if self.lang is None else self.lang,
+            text,
+        )
+
+    def from_cache(self, filename: str, text: str) -> Optional[float]:
+        """Links the cached audio of the text to {filename}.mp3, returns its length if cached"""
+        if self.cache is None:
+            return None
+        length = self.cache.fetch(self.cache_key(text), f"{self.path}/{filename}.mp3")
+        if length is not None:
+            self.lengths[filename] = length
+        return length
+
+    def saved(self, filename: str, text: str) -> float:
+        """Records the length of {filename}.mp3 the TTS module saved and adds it to the TTS cache"""
+        filepath = f"{self.path}/{filename}.mp3"
+        length = get_duration(filepath)
+        if not length:
+            return 0
+        if self.cache is not None:
+            self.cache.store(self.cache_key(text), filepath, length)
+        self.lengths[filename] = length
+        self.samples.append((len(text), length))
+        return length
+
+    def voice(self) -> str:
+        return get_voice(type(self.tts_module).__name__)
+
+
+def get_voice(provider: str) -> str:
+    """The voice setting of the TTS module, empty for modules without one"""
+    setting = VOICE_SETTINGS.get(provider)
+    return str(settings.config["settings"]["tts"][setting]) if setting else ""
+
+
+def process_text(text: str, lang: str = None):
+    return sanitize_text(translate_text(text, lang))
@@ -0,0 +1,89 @@
+import json
+from typing import Dict, List, Tuple
+
+from utils import settings
+from utils.console import print_substep
+from utils.shared import update_json
+from utils.voice import sanitize_text
+
+RATES_FILE = "assets/tts_rates.json"
+DEFAULT_RATE = 15.0  # characters per second of an average TTS voice
+MAX_HISTORY = 3600  # seconds of audio the calibration remembers, older clips weigh less
+
+
+def load_rates() -> Dict[str, Dict[str, float]]:
+    try:
+        with open(RATES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_rate(provider: str, voice: str) -> float:
+    """Characters per second the voice was measured to speak at, DEFAULT_RATE if never measured"""
+    rate = load_rates().get(f"{provider}:{voice}")
+    if not rate or not rate["seconds"]:
+        return DEFAULT_RATE
+    return rate["chars"] / rate["seconds"]
+
+
+def record_rate(provider: str, voice: str, samples: List[Tuple[int, float]]):
+    """Adds synthesized clips to the calibration of the voice.
+
+    Args:
+        provider (str): Name of the TTS module
+        voice (str): The voice setting of the TTS module
+        samples (List[Tuple[int, float]]): Characters and seconds of every synthesized clip
+    """
+    if not samples:
+        return
+
+    def add(rates: Dict[str, Dict[str, float]]):
+        rate = rates.setdefault(f"{provider}:{voice}", {"chars": 0, "seconds": 0})
+        rate["chars"] += sum(chars for chars, _ in samples)
+        rate["seconds"] += sum(seconds for _, seconds in samples)
+        if rate["seconds"] > MAX_HISTORY:
+            scale = MAX_HISTORY / rate["seconds"]
+            rate["chars"] *= scale
+            rate["seconds"] *= scale
+
+    update_json(RATES_FILE, add, indent=4)
+
+
+def estimate(text: str, rate: float) -> float:
+    """Estimated seconds it takes to speak the text at rate characters per second"""
+    return len(sanitize_text(text)) / rate
+
+
+def plan_comments(reddit_object: dict, provider: str, voice: str, max_length: int) -> List[dict]:
+    """Picks the comments that fit in the video before any of them are synthesized.
+
+    The comments are taken in the order reddit ranked them, skipping the ones whose estimated
+    length doesn't fit in what is left of max_length after the title (and story text).
+
+    Args:
+        reddit_object (dict): The reddit object that contains the posts to read
+        provider (str): Name of the TTS module
+        voice (str): The voice setting of the TTS module
+        max_length (int): The maximum length of the audio in total
+
+    Returns:
+        List[dict]: The planned comments, in order
+    """
+    rate = get_rate(provider, voice)
+    remaining = max_length - estimate(reddit_object["thread_title"], rate)
+    if settings.config["settings"]["storymode"]:
+        remaining -= estimate(reddit_object["thread_post"], rate)
+
+    planned = []
+    for comment in reddit_object["comments"]:
+        seconds = estimate(comment["comment_body"], rate)
+        if seconds <= remaining:
+            planned.append(comment)
+            remaining -= seconds
+    print_substep(
+        f"Planned {len(planned)} comments, about {max_length - remaining:.0f}s of audio "
+        f"at {rate:.1f} characters per second",
+        style="bold blue",
+    )
+    return planned
@@ -1,12 +1,60 @@
 import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
 import pyttsx3
 from utils import settings
 
+_engine = None  # the pyttsx3 engine of this process, the worker process's in worker mode
+
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        _engine = pyttsx3.init()
+    return _engine
+
+
+def _voice_ids() -> List[str]:
+    return [voice.id for voice in _get_engine().getProperty("voices")]
+
+
+def _save_to_files(jobs: List[Tuple[str, str, str]]):
+    """Queues every (text, filepath, voice id) job on the engine and runs them all at once"""
+    engine = _get_engine()
+    for text, filepath, voice in jobs:
+        engine.setProperty("voice", voice)  # queued too, so it applies to the next file only
+        engine.save_to_file(text, filepath)
+    engine.runAndWait()
+
 
 class pyttsx:
     def __init__(self):
         self.max_chars = 5000
-        self.voices = []
+        self.max_concurrency = 1  # pyttsx3 engines can't be driven from several threads
+        self.voices = None
+        self.voice = None
+        self.worker = None
+        if settings.config["settings"]["tts"]["pyttsx_worker"]:
+            self.worker = ProcessPoolExecutor(max_workers=1)
+
+    def call(self, func, *args):
+        """Runs func in the worker process if there is one, in this process if not"""
+        if self.worker is None:
+            return func(*args)
+        return self.worker.submit(func, *args).result()
+
+    def resolve_voices(self):
+        """Looks up the system voices once, keeping the first py_voice_num of them"""
+        if self.voices is not None:
+            return
+        voice_id = settings.config["settings"]["tts"]["python_voice"]
+        voice_num = settings.config["settings"]["tts"]["py_voice_num"]
+        if voice_id == "" or voice_num == "":
+            raise ValueError("set pyttsx values to a valid value, switching to defaults")
+        ids = self.call(_voice_ids)
+        self.voices = ids[: int(voice_num)]
+        self.voice = ids[int(voice_id)]  # changing index changes voices
 
     def run(
         self,
@@ -14,27 +62,28 @@ class pyttsx:
         filepath: str,
         random_voice=False,
     ):
-        voice_id = settings.config["settings"]["tts"]["python_voice"]
-        voice_num = settings.config["settings"]["tts"]["py_voice_num"]
-        if voice_id == "" or voice_num == "":
-            voice_id = 2
-            voice_num = 3
-            raise ValueError("set pyttsx values to a valid value, switching to defaults")
-        else:
-            voice_id = int(voice_id)
-            voice_num = int(voice_num)
-        for i in range(voice_num):
-            self.voices.append(i)
-            i = +1
-        if random_voice:
-            voice_id = self.randomvoice()
-        engine = pyttsx3.init()
-        voices = engine.getProperty("voices")
-        engine.setProperty(
-            "voice", voices[voice_id].id
-        )  # changing index changes voices but ony 0 and 1 are working here
-        engine.save_to_file(text, f"{filepath}")
-        engine.runAndWait()
+        self.run_batch([(text, filepath)], random_voice)
+
+    def run_batch(self, jobs: List[Tuple[str, str]], random_voice=False):
+        """Saves every (text, filepath) job with a single runAndWait of the engine.
+
+        Args:
+            jobs (List[Tuple[str, str]]): Texts and the paths to save them to
+            random_voice (bool): Whether every file gets a random voice
+        """
+        self.resolve_voices()
+        self.call(
+            _save_to_files,
+            [
+                (text, filepath, self.randomvoice() if random_voice else self.voice)
+                for text, filepath in jobs
+            ],
+        )
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.shutdown()
+            self.worker = None
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -1,8 +1,8 @@
 import random
-import requests
 from requests.exceptions import JSONDecodeError
 from utils import settings
-from utils.voice import check_ratelimit
+from utils.sessions import pooled_session
+from utils.ratelimit import limited
 
 voices = [
     "Brian",
@@ -30,7 +30,9 @@ class StreamlabsPolly:
     def __init__(self):
         self.url = "https://streamlabs.com/polly/speak"
         self.max_chars = 550
+        self.max_concurrency = 2
         self.voices = voices
+        self.session = pooled_session(self.max_concurrency)
 
     def run(self, text, filepath, random_voice: bool = False):
         if random_voice:
@@ -42,21 +44,19 @@ class StreamlabsPolly:
                 )
             voice = str(settings.config["settings"]["tts"]["streamlabs_polly_voice"]).capitalize()
         body = {"voice": voice, "text": text, "service": "polly"}
-        response = requests.post(self.url, data=body)
-        if not check_ratelimit(response):
-            self.run(text, filepath, random_voice)
-
-        else:
+        # rate limits are waited out by the rate limiter
+        response = limited("StreamlabsPolly", lambda: self.session.post(self.url, data=body))
+        try:
+            speak_url = response.json()["speak_url"]  # not retried, a retry gets the same body
+            voice_data = limited("StreamlabsPolly", lambda: self.session.get(speak_url))
+            with open(filepath, "wb") as f:
+                f.write(voice_data.content)
+        except (KeyError, JSONDecodeError):
             try:
-                voice_data = requests.get(response.json()["speak_url"])
-                with open(filepath, "wb") as f:
-                    f.write(voice_data.content)
+                if response.json()["error"] == "No text specified!":
+                    raise ValueError("Please specify a text to convert to speech.")
             except (KeyError, JSONDecodeError):
-                try:
-                    if response.json()["error"] == "No text specified!":
-                        raise ValueError("Please specify a text to convert to speech.")
-                except (KeyError, JSONDecodeError):
-                    print("Error occurred calling Streamlabs Polly")
+                print("Error occurred calling Streamlabs Polly")
 
     def randomvoice(self):
         return random.choice(self.voices)
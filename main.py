@@ -1,26 +1,33 @@
 #!/usr/bin/env python
 import math
 import re
+import time
 from subprocess import Popen
 from os import name
 
 from prawcore import ResponseException
 
 from reddit.subreddit import get_subreddit_threads
+from utils.browser import browser_pool, close_browser_pool
 from utils.cleanup import cleanup
+from utils.encoder import get_encoder_profile
 from utils.console import print_markdown, print_step, print_substep
 from utils import settings
 from utils.id import id
+from utils.scheduler import Stage, run_stages
+from utils.translate import get_languages, translate_thread
 from utils.version import checkversion
 
 from video_creation.background import (
     download_background,
     chop_background_video,
     get_background_config,
+    prepare_background,
 )
-from video_creation.final_video import make_final_video
+from video_creation.cards import render_cards
+from video_creation.final_video import make_final_video, make_renditions
 from video_creation.screenshot_downloader import download_screenshots_of_reddit_posts
-from video_creation.voices import save_text_to_mp3
+from video_creation.voices import plan_comments_to_read, save_text_to_mp3
 
 __VERSION__ = "2.4.1"
 
@@ -42,16 +49,83 @@ checkversion(__VERSION__)
 
 
 def main(POST_ID=None):
+    start = time.perf_counter()
+    pillow = settings.config["settings"]["screenshots"]["renderer"] == "pillow"
+    if not pillow:
+        browser_pool().warm()  # launches the browser while the thread is fetched
     reddit_object = get_subreddit_threads(POST_ID)
+    fetched = time.perf_counter() - start
     global redditid
     redditid = id(reddit_object)
-    length, number_of_comments = save_text_to_mp3(reddit_object)
-    length = math.ceil(length)
-    download_screenshots_of_reddit_posts(reddit_object, number_of_comments)
     bg_config = get_background_config()
-    download_background(bg_config)
-    chop_background_video(bg_config, length, reddit_object)
-    make_final_video(number_of_comments, length, reddit_object, bg_config)
+    plan_comments_to_read(reddit_object)
+    translate_thread(reddit_object)
+    languages = get_languages()
+
+    def tts():
+        if len(languages) == 1:
+            return [save_text_to_mp3(reddit_object)]
+        # one language after the other, rich only shows one progress bar at a time
+        return [save_text_to_mp3(reddit_object, lang) for lang in languages]
+
+    def chop(tts, background):
+        length = max(length for length, _ in tts)
+        return chop_background_video(bg_config, math.ceil(length), reddit_object, background)
+
+    def render(tts, _, background):
+        if len(languages) == 1:
+            length = math.ceil(tts[0][0])
+            make_final_video(tts[0][1], length, reddit_object, bg_config, background)
+            return
+        renditions = [
+            (lang, number_of_comments, math.ceil(length))
+            for lang, (length, number_of_comments) in zip(languages, tts)
+        ]
+        make_renditions(renditions, reddit_object, bg_config, background)
+
+    timings = {}
+    run_stages(
+        [
+            Stage("tts", tts),
+            Stage(
+                "screenshots",
+                lambda: (render_cards if pillow else download_screenshots_of_reddit_posts)(
+                    reddit_object, len(reddit_object["comments"])
+                ),
+            ),
+            Stage("background download", lambda: download_background(bg_config)),
+            Stage(
+                "background prepare",
+                lambda _: prepare_background(bg_config),
+                ("background download",),
+            ),
+            Stage("background chop", chop, ("tts", "background prepare")),
+            Stage("render", render, ("tts", "screenshots", "background chop")),
+        ],
+        timings,
+    )
+    if len(languages) > 1:
+        report_renditions(languages, fetched, timings)
+
+
+def report_renditions(languages, fetched: float, timings: dict):
+    """Compares the time of a multi-language run with running once per language.
+
+    Args:
+        languages (List[str]): Languages of the run
+        fetched (float): Seconds it took to fetch the thread from reddit
+        timings (dict): Start and end of every stage, from run_stages
+    """
+    took = fetched + max(finished for _, finished in timings.values())
+    shared = fetched + sum(
+        timings[name][1] - timings[name][0] for name in ("screenshots", "background chop")
+    )
+    print_substep(
+        f"Made {len(languages)} videos in {took:.1f}s. One run per language would fetch the "
+        f"thread, take the screenshots and chop the background {len(languages)} times, about "
+        f"{took + shared * (len(languages) - 1):.1f}s",
+        style="bold blue",
+    )
 
 
 def run_many(times):
@@ -64,10 +138,16 @@ def run_many(times):
 
 
 def shutdown():
-    pass
+    if "redditid" in globals():
+        print_markdown("## Clearing temp files")
+        cleanup(redditid)
+    close_browser_pool()
+
+
 if __name__ == "__main__":
     config = settings.check_toml("utils/.config.template.toml", "config.toml")
     config is False and exit()
+    get_encoder_profile()
     try:
         if config["settings"]["times_to_run"]:
             run_many(config["settings"]["times_to_run"])
@@ -82,6 +162,7 @@ if __name__ == "__main__":
                 Popen("cls" if name == "nt" else "clear", shell=True).wait()
         else:
             main()
+        close_browser_pool()
     except KeyboardInterrupt:
         shutdown()
     except ResponseException:
@@ -94,6 +94,10 @@ def get_subreddit_threads(POST_ID: str):
     content["thread_title"] = submission.title
     content["thread_post"] = submission.selftext
     content["thread_id"] = submission.id
+    content["thread_author"] = str(submission.author or "[deleted]")
+    content["thread_score"] = upvotes
+    content["thread_num_comments"] = num_comments
+    content["thread_subreddit"] = submission.subreddit.display_name
     content["comments"] = []
 
     for top_level_comment in submission.comments:
@@ -117,6 +121,8 @@ def get_subreddit_threads(POST_ID: str):
                             "comment_body": top_level_comment.body,
                             "comment_url": top_level_comment.permalink,
                             "comment_id": top_level_comment.id,
+                            "comment_author": str(top_level_comment.author or "[deleted]"),
+                            "comment_score": top_level_comment.score,
                         }
                     )
     print_substep("Received subreddit threads Successfully.", style="bold green")
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import TTS.cache
+from TTS.cache import TTSCache
+
+
+def clip(path, data=b"audio"):
+    Path(path).write_bytes(data)
+    return str(path)
+
+
+def test_fetches_stored_clips(tmp_path):
+    cache = TTSCache(1024, str(tmp_path / "cache"))
+    key = cache.key("TikTok", "en_us_001", "", "Hello there.")
+    assert cache.fetch(key, str(tmp_path / "0.mp3")) is None
+    cache.store(key, clip(tmp_path / "0.mp3"), 1.5)
+    assert cache.fetch(key, str(tmp_path / "1.mp3")) == 1.5
+    assert (tmp_path / "1.mp3").read_bytes() == b"audio"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_the_least_recently_used(tmp_path):
+    cache = TTSCache(10, str(tmp_path / "cache"))
+    cache.store("old", clip(tmp_path / "a.mp3", b"12345"), 1)
+    cache.store("new", clip(tmp_path / "b.mp3", b"12345"), 1)
+    cache.store("newest", clip(tmp_path / "c.mp3", b"12345"), 1)
+    assert cache.fetch("old", str(tmp_path / "d.mp3")) is None
+    assert cache.fetch("newest", str(tmp_path / "d.mp3")) == 1
+
+
+def test_clip_evicted_by_another_job_during_fetch_is_a_miss(tmp_path, monkeypatch):
+    cache = TTSCache(1024, str(tmp_path / "cache"))
+    cache.store("key", clip(tmp_path / "0.mp3"), 1.5)
+    link = TTS.cache._link
+
+    def evicted_first(src, dst):
+        Path(src).unlink()  # what another job's evict does between the check and the link
+        link(src, dst)
+
+    monkeypatch.setattr(TTS.cache, "_link", evicted_first)
+    assert cache.fetch("key", str(tmp_path / "1.mp3")) is None
+    assert "key" not in cache.index
+    assert (cache.hits, cache.misses) == (0, 1)
@@ -0,0 +1,30 @@
+import pytest
+
+from video_creation.cards import format_score
+
+
+@pytest.mark.parametrize(
+    "score, text",
+    [
+        (0, "0"),
+        (None, "0"),
+        (999, "999"),
+        (-999, "-999"),
+        (1000, "1.0k"),
+        (12345, "12.3k"),
+        (99949, "99.9k"),
+        (99950, "100k"),
+        (99999, "100k"),
+        (100000, "100k"),
+        (123456, "123k"),
+        (999499, "999k"),
+        (999500, "1.0m"),
+        (999999, "1.0m"),
+        (1234567, "1.2m"),
+        (99999999, "100m"),
+        (1234567890, "1235m"),
+        (-99999, "-100k"),
+    ],
+)
+def test_format_score(score, text):
+    assert format_score(score) == text
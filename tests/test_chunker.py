@@ -0,0 +1,84 @@
+import re
+import time
+
+import pytest
+
+from TTS.chunker import _regex_split as regex_split
+from TTS.chunker import split_text
+
+NORMAL = (
+    "I worked at a pizza place for three years. One night a guy ordered forty pizzas, "
+    "all plain cheese, to a hotel. We called back and he was real. Tipped fifty bucks too. "
+) * 40
+
+
+def squash(text):
+    return re.sub(r"\s+", "", text)
+
+
+@pytest.mark.parametrize("max_chars", [100, 200, 300])
+def test_same_chunks_as_the_regex_on_period_separated_text(max_chars):
+    # the regex matched max_chars characters and then the period
+    assert split_text(NORMAL, max_chars) == regex_split(NORMAL, max_chars - 1)
+
+
+def test_keeps_the_text_in_front_of_windows_without_periods():
+    text = "word " * 200 + "the end."
+    chunks = split_text(text, 100)
+    assert squash("".join(chunks)) == squash(text)
+    assert squash("".join(regex_split(text, 99))) != squash(text)  # what the regex dropped
+
+
+def test_ends_at_the_last_sentence_end():
+    assert split_text("One two. Three four! Five six", 20) == ["One two. Three four!", "Five six"]
+
+
+def test_falls_back_to_the_last_clause_end():
+    assert split_text("one two, three four; five six seven", 22) == [
+        "one two, three four;",
+        "five six seven",
+    ]
+
+
+def test_falls_back_to_the_last_space():
+    assert split_text("aaaa bbbb cccc dddd", 12) == ["aaaa bbbb", "cccc dddd"]
+
+
+def test_cuts_words_without_spaces():
+    assert split_text("a" * 25, 10) == ["a" * 10, "a" * 10, "a" * 5]
+
+
+def test_ignores_punctuation_inside_words():
+    assert split_text("version 1.5 of e.g. this tool", 15) == ["version 1.5 of", "e.g. this tool"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        NORMAL,
+        "word " * 500,
+        "a line of text\n" * 300,
+        "x" * 1000,
+        "short, clauses; only: here, " * 60,
+    ],
+)
+@pytest.mark.parametrize("max_chars", [1, 7, 50, 299])
+def test_chunks_fit_and_keep_all_the_text(text, max_chars):
+    chunks = split_text(text, max_chars)
+    assert all(0 < len(chunk) <= max_chars for chunk in chunks)
+    assert squash("".join(chunks)) == squash(text)
+
+
+@pytest.mark.parametrize(
+    "text", ["word " * 2000, "a line of text\n" * 700, "and then it happened " * 5000 + "."]
+)
+def test_linear_time_without_periods(text):
+    # the regex took seconds on the first two, split_text about a millisecond
+    start = time.perf_counter()
+    split_text(text, 5000)
+    assert time.perf_counter() - start < 0.2
+
+
+def test_empty_and_blank_text():
+    assert split_text("", 10) == []
+    assert split_text("   \n ", 10) == []
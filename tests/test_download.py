@@ -0,0 +1,127 @@
+import http.server
+import json
+import os
+import threading
+from pathlib import Path
+
+import pytest
+
+import utils.download
+from utils.download import download
+
+CHUNK = 64 * 1024
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the data of the server, with single byte ranges unless server.ranges is False"""
+
+    def do_GET(self):
+        data = self.server.data
+        header = self.headers.get("Range")
+        if not header or not self.server.ranges:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        with self.server.lock:
+            self.server.ranged += 1
+            count = self.server.ranged
+        if self.server.fail(count):
+            self.send_error(503)
+            return
+        first, last = header.split("=")[1].split("-")
+        body = data[int(first) : int(last) + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {first}-{last}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("localhost", 0), RangeHandler)
+    server.data = os.urandom(10 * CHUNK + 123)
+    server.lock = threading.Lock()
+    server.ranges = True
+    server.ranged = 0
+    server.fail = lambda count: False
+    server.url = f"http://localhost:{server.server_port}/source.bin"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(utils.download, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(utils.download, "MAX_RETRIES", 2)
+
+
+def test_downloads_in_ranges(server, tmp_path):
+    target = tmp_path / "target.bin"
+    download(server.url, str(target), chunk_size=CHUNK)
+    assert target.read_bytes() == server.data
+    assert os.listdir(tmp_path) == ["target.bin"]
+
+
+def test_retries_failed_ranges(server, tmp_path):
+    server.fail = lambda count: count % 3 == 0
+    target = tmp_path / "target.bin"
+    download(server.url, str(target), workers=1, chunk_size=CHUNK)
+    assert target.read_bytes() == server.data
+
+
+def test_resumes_after_an_interrupted_download(server, tmp_path):
+    target = tmp_path / "target.bin"
+    server.fail = lambda count: count > 5  # the probe and four chunks, then the server is down
+    with pytest.raises(Exception):
+        download(server.url, str(target), workers=1, chunk_size=CHUNK)
+    assert not target.exists()
+    done = json.loads(Path(f"{target}.part.json").read_text())["done"]
+    assert len(done) == 4
+
+    server.fail = lambda count: False
+    server.ranged = 0
+    download(server.url, str(target), workers=1, chunk_size=CHUNK)
+    assert target.read_bytes() == server.data
+    assert server.ranged == 1 + 11 - len(done)  # the probe and the missing chunks only
+    assert not Path(f"{target}.part").exists()
+    assert not Path(f"{target}.part.json").exists()
+
+
+def test_verify_rejects_the_file_before_the_rename(server, tmp_path):
+    target = tmp_path / "target.bin"
+    with pytest.raises(ValueError):
+        download(server.url, str(target), chunk_size=CHUNK, verify=lambda part: False)
+    assert os.listdir(tmp_path) == []
+
+
+def test_verify_sees_the_complete_part_file(server, tmp_path):
+    target = tmp_path / "target.bin"
+    seen = []
+    download(
+        server.url,
+        str(target),
+        chunk_size=CHUNK,
+        verify=lambda part: seen.append(Path(part).read_bytes()) or True,
+    )
+    assert seen == [server.data]
+
+
+def test_wrong_size_is_not_renamed(server, tmp_path, monkeypatch):
+    def truncated(session, url, part):
+        Path(part).write_bytes(server.data[:-1])
+        return len(server.data)
+
+    server.ranges = False  # so the file is streamed
+    monkeypatch.setattr(utils.download, "_download_stream", truncated)
+    target = tmp_path / "target.bin"
+    with pytest.raises(ValueError):
+        download(server.url, str(target), chunk_size=CHUNK)
+    assert not target.exists()
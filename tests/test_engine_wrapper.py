@@ -0,0 +1,107 @@
+import threading
+import time
+import wave
+
+import pytest
+
+from TTS.engine_wrapper import TTSEngine
+from utils import settings
+
+COMMENTS = [
+    "First.",
+    "A somewhat longer second comment.",
+    "Third one here.",
+    "Four.",
+    "The fifth comment is the longest of them all by a good margin.",
+    "Six is short.",
+    "Seven.",
+    "Eighth comment, the last one.",
+]
+
+
+class FakeTTS:
+    """Writes a WAV of 0.1s per character after sleeping, records how many calls overlap"""
+
+    max_chars = 1000
+    max_concurrency = 3
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def run(self, text, filepath):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01 * (len(text) % 4 + 1))  # so the clips finish out of order
+        with wave.open(filepath, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(1)
+            wav.setframerate(8000)
+            wav.writeframes(b"\x80" * 800 * len(text))
+        with self.lock:
+            self.active -= 1
+
+
+class SerialFakeTTS(FakeTTS):
+    max_concurrency = 1
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # the voice calibration is saved to assets/
+    monkeypatch.setattr(
+        settings,
+        "config",
+        {
+            "reddit": {"thread": {"post_lang": ""}},
+            "settings": {"storymode": False, "tts": {"cache_size": 0, "concurrency": 0}},
+        },
+    )
+
+
+def synthesize(tts_module, tmp_path, max_length=1000):
+    thread = {
+        "thread_id": "abc",
+        "thread_title": "A title",
+        "thread_post": "",
+        "comments": [{"comment_body": body} for body in COMMENTS],
+    }
+    path = f"{tmp_path}/{tts_module.__name__}/"
+    engine = TTSEngine(tts_module, thread, path=path, max_length=max_length)
+    result = engine.run()
+    clips = {name: (path + "abc/mp3/" + name + ".mp3") for name in engine.lengths}
+    return result, engine, {name: open(clip, "rb").read() for name, clip in clips.items()}
+
+
+def test_same_clips_as_the_serial_run(tmp_path):
+    serial, _, serial_clips = synthesize(SerialFakeTTS, tmp_path)
+    concurrent, engine, clips = synthesize(FakeTTS, tmp_path)
+    assert concurrent == serial
+    assert concurrent[1] == len(COMMENTS)
+    assert clips == serial_clips
+    assert [engine.lengths[f"{idx}"] for idx in range(len(COMMENTS))] == [
+        pytest.approx(len(body) / 10) for body in COMMENTS
+    ]
+
+
+@pytest.mark.parametrize("max_length", [3, 5, 8, 12.5])
+def test_same_cut_off_as_the_serial_run(tmp_path, max_length):
+    serial, _, _ = synthesize(SerialFakeTTS, tmp_path, max_length)
+    concurrent, _, _ = synthesize(FakeTTS, tmp_path, max_length)
+    assert concurrent == serial
+    assert 0 < concurrent[1] < len(COMMENTS)
+
+
+def test_at_most_max_concurrency_calls_at_once(tmp_path):
+    _, engine, _ = synthesize(FakeTTS, tmp_path)
+    assert engine.tts_module.peak == FakeTTS.max_concurrency
+    _, engine, _ = synthesize(SerialFakeTTS, tmp_path)
+    assert engine.tts_module.peak == 1
+
+
+def test_concurrency_setting_lowers_the_limit(tmp_path):
+    settings.config["settings"]["tts"]["concurrency"] = 2
+    _, engine, _ = synthesize(FakeTTS, tmp_path)
+    assert engine.tts_module.peak <= 2
@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from utils.scheduler import Stage, run_stages
+
+
+def test_runs_stages_after_their_requirements():
+    stages = [
+        Stage("reddit", lambda: 2),
+        Stage("tts", lambda reddit: reddit * 3, ("reddit",)),
+        Stage("background", lambda: 5),
+        Stage("render", lambda tts, background: tts + background, ("tts", "background")),
+    ]
+    assert run_stages(stages)["render"] == 11
+
+
+def test_independent_stages_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+    stages = [Stage("a", barrier.wait), Stage("b", barrier.wait)]
+    run_stages(stages)  # a BrokenBarrierError if they ran one after the other
+
+
+def test_rejects_unknown_and_circular_requirements():
+    with pytest.raises(ValueError):
+        run_stages([Stage("a", lambda b: b, ("b",))])
+    with pytest.raises(ValueError):
+        run_stages([Stage("a", lambda b: b, ("b",)), Stage("b", lambda a: a, ("a",))])
+
+
+def test_failure_surfaces_before_the_other_stages_finish():
+    release = threading.Event()
+    ran = []
+
+    def fail():
+        raise RuntimeError("stage failed")
+
+    stages = [
+        Stage("slow", lambda: release.wait(5)),
+        Stage("fail", fail),
+        Stage("after", lambda _: ran.append(True), ("fail",)),
+    ]
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match="stage failed"):
+        run_stages(stages)
+    assert time.perf_counter() - start < 2
+    release.set()
+    assert not ran
@@ -0,0 +1,78 @@
+import http.server
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from utils import settings
+from utils.sessions import pooled_session
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every POST like a TTS API, counts the connections it was sent on"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are sent separately
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"data": {"v_str": ""}}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("localhost", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.url = f"http://localhost:{server.server_port}/speak"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool_setting(monkeypatch):
+    config = {"settings": {"tts": {"http_pool_size": 0}}}
+    monkeypatch.setattr(settings, "config", config)
+    return config["settings"]["tts"]
+
+
+def test_reuses_one_connection(server, pool_setting):
+    session = pooled_session(1)
+    for _ in range(20):
+        session.post(server.url, data={"text": "This is a comment."}).raise_for_status()
+    assert server.connections == 1
+
+
+def test_without_a_session_every_request_connects(server, pool_setting):
+    for _ in range(5):
+        requests.post(server.url, data={"text": "This is a comment."}).raise_for_status()
+    assert server.connections == 5
+
+
+def test_threads_share_at_most_pool_size_connections(server, pool_setting):
+    session = pooled_session(2)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for response in pool.map(lambda _: session.post(server.url, data={"a": 1}), range(40)):
+            response.raise_for_status()
+    assert server.connections <= 2
+
+
+def test_setting_overrides_the_pool_size(pool_setting):
+    pool_setting["http_pool_size"] = 7
+    adapter = pooled_session(2).get_adapter("https://example.com")
+    assert adapter._pool_maxsize == 7
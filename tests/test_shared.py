@@ -0,0 +1,13 @@
+from pathlib import Path
+
+from utils.shared import temp_path
+
+
+def test_temp_path_keeps_the_extension(tmp_path):
+    target = tmp_path / "prepared" / "abc.mp4"
+    first, second = temp_path(str(target), ".mp4"), temp_path(str(target), ".mp4")
+    assert first != second
+    for temp in (first, second):
+        assert temp.endswith(".mp4")
+        assert Path(temp).parent == target.parent
+        assert Path(temp).is_file()
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from utils import translate
+
+
+class FakeTranslator:
+    """Tags every line with the language and records the requests it was sent"""
+
+    def __init__(self, drop_line: bool = False):
+        self.requests = []
+        self.drop_line = drop_line  # answer batches with one line too few, like a merged line
+
+    def __call__(self, text, lang):
+        self.requests.append(text)
+        lines = [f"[{lang}] {line}" for line in text.split("\n")]
+        if self.drop_line and len(lines) > 1:
+            lines = lines[:-1]
+        return "\n".join(lines)
+
+
+@pytest.fixture
+def translator(monkeypatch, tmp_path):
+    monkeypatch.setattr(translate, "CACHE_FILE", str(tmp_path / "translations.json"))
+    monkeypatch.setattr(translate, "_cache", {})
+    monkeypatch.setattr(translate, "_loaded", False)
+    fake = FakeTranslator()
+    monkeypatch.setattr(translate, "translator", fake)
+    return fake
+
+
+def test_translates_in_one_request(translator):
+    texts = ["First comment.", "Second\ncomment.", "Third comment."]
+    assert translate.translate(texts, "de") == [
+        "[de] First comment.",
+        "[de] Second comment.",
+        "[de] Third comment.",
+    ]
+    assert len(translator.requests) == 1
+
+
+def test_splits_batches_at_the_request_size(translator, monkeypatch):
+    monkeypatch.setattr(translate, "MAX_REQUEST_CHARS", 50)
+    texts = [f"Comment number {i:02}." for i in range(10)]  # 18 characters each
+    assert translate.translate(texts, "de") == [f"[de] {text}" for text in texts]
+    assert len(translator.requests) == 5
+    assert all(len(request) <= 50 for request in translator.requests)
+
+
+def test_retries_one_by_one_when_the_line_count_differs(translator):
+    translator.drop_line = True
+    texts = ["One.", "Two.", "Three."]
+    assert translate.translate(texts, "fr") == ["[fr] One.", "[fr] Two.", "[fr] Three."]
+    assert translator.requests == ["One.\nTwo.\nThree.", "One.", "Two.", "Three."]
+
+
+def test_sends_each_text_once_and_leaves_blank_texts(translator):
+    assert translate.translate(["Same.", "", "Same."], "de") == ["[de] Same.", "", "[de] Same."]
+    assert translator.requests == ["Same."]
+
+
+def test_cache_persists_across_runs(translator, monkeypatch):
+    translate.translate(["Cached comment."], "de")
+    saved = json.loads(open(translate.CACHE_FILE, encoding="utf-8").read())
+    assert list(saved.values()) == ["[de] Cached comment."]
+
+    # a new run starts with an empty cache in memory
+    monkeypatch.setattr(translate, "_cache", {})
+    monkeypatch.setattr(translate, "_loaded", False)
+    translator.requests.clear()
+    assert translate.translate(["Cached comment.", "New comment."], "de") == [
+        "[de] Cached comment.",
+        "[de] New comment.",
+    ]
+    assert translator.requests == ["New comment."]
+    assert translate.translate(["Cached comment."], "fr") == ["[fr] Cached comment."]
@@ -0,0 +1,122 @@
+import json
+import wave
+from typing import Dict, List, Optional
+
+import mutagen
+from mutagen import MutagenError
+from mutagen.mp3 import MP3
+
+# Layer III bitrates in kbit/s by bitrate index, for MPEG 1 and for MPEG 2 / 2.5
+BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# sample rates by sample rate index, for MPEG 1, 2 and 2.5 (version bits 3, 2 and 0)
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def get_duration(path: str) -> float:
+    """Reads the length of an audio file from its headers, without decoding it.
+
+    Args:
+        path (str): Path of the MP3 or WAV file (some TTS modules write WAV data to .mp3 paths)
+
+    Returns:
+        float: Length in seconds, 0 if the file isn't readable audio
+    """
+    try:
+        audio = mutagen.File(path)
+        if audio is not None and audio.info.length:
+            return audio.info.length
+    except MutagenError:
+        pass
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return 0
+
+
+def save_manifest(path: str, lengths: Dict[str, float]):
+    """Saves the length of every clip in path to path/manifest.json, keyed by file name without .mp3"""
+    with open(f"{path}/manifest.json", "w", encoding="utf-8") as f:
+        json.dump(lengths, f, indent=4)
+
+
+def load_manifest(path: str) -> Dict[str, float]:
+    """Loads the clip lengths saved by save_manifest, empty if there is no manifest"""
+    try:
+        with open(f"{path}/manifest.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def concat_mp3(parts: List[str], output: str) -> bool:
+    """Joins MP3 files frame by frame, without decoding them.
+
+    Only possible when all parts are Layer III with the same sample rate and channel count. The
+    ID3 tags and the Xing/Info/VBRI header frame of every part are dropped, since they describe
+    the part and not the joined file.
+
+    Args:
+        parts (List[str]): Paths of the MP3 files, in order
+        output (str): Path to write the joined file to
+
+    Returns:
+        bool: Whether the parts could be joined, nothing is written if not
+    """
+    try:
+        infos = [MP3(part).info for part in parts]
+    except MutagenError:
+        return False
+    if any(info.layer != 3 for info in infos):
+        return False
+    if len({(info.sample_rate, info.channels, info.version) for info in infos}) != 1:
+        return False
+
+    frames = []
+    for part in parts:
+        with open(part, "rb") as f:
+            data = _mp3_frames(f.read())
+        if data is None:
+            return False
+        frames.append(data)
+    with open(output, "wb") as f:
+        for data in frames:
+            f.write(data)
+    return True
+
+
+def _mp3_frames(data: bytes) -> Optional[bytes]:
+    """Strips the tags and the VBR header frame from an MP3 file, leaving only the audio frames"""
+    start, end = 0, len(data)
+    if data[:3] == b"ID3":
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)  # the footer flag adds 10 bytes
+    if data[end - 128 : end - 125] == b"TAG":
+        end -= 128
+    while start + 4 <= end and not (data[start] == 0xFF and data[start + 1] & 0xE0 == 0xE0):
+        start += 1
+    if start + 4 > end:
+        return None
+
+    length = _frame_length(data[start : start + 4])
+    if length is None:
+        return None
+    if any(tag in data[start : start + min(length, 64)] for tag in (b"Xing", b"Info", b"VBRI")):
+        start += length
+    return data[start:end]
+
+
+def _frame_length(header: bytes) -> Optional[int]:
+    """Length in bytes of the Layer III frame starting with header"""
+    version = header[1] >> 3 & 3
+    bitrate_index = header[2] >> 4
+    sample_rate_index = header[2] >> 2 & 3
+    if version == 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = header[2] >> 1 & 1
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
@@ -0,0 +1,308 @@
+import asyncio
+import json
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+
+from playwright.async_api import Error, async_playwright
+
+from utils import settings
+from utils.console import print_substep
+
+T = TypeVar("T")
+
+COOKIE_FILES = {
+    "dark": "./video_creation/data/cookie-dark-mode.json",
+    "light": "./video_creation/data/cookie-light-mode.json",
+}
+VIEWPORT = {"width": 1920, "height": 1080}
+DEFAULT_RECYCLE = 25  # videos a browser makes screenshots for before it is restarted
+DEFAULT_TIMEOUT = 30  # seconds a navigation or screenshot may take
+
+# what the post and comment cards need, everything else is blocked by the network filter
+ALLOWED_HOSTS = ("reddit.com", "redditstatic.com", "redditmedia.com")
+ALLOWED_TYPES = {"document", "stylesheet", "script", "font", "xhr", "fetch", "image"}
+IMAGE_HOSTS = ("redditstatic.com", "redditmedia.com")  # icons and avatars, not post media
+TRACKER_HOSTS = (
+    "events.reddit.com",
+    "w3-reporting.reddit.com",
+    "error-tracking.reddit.com",
+    "alb.reddit.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "amazon-adsystem.com",
+    "scorecardresearch.com",
+    "adsrvr.org",
+    "quantserve.com",
+)
+
+
+def _on_host(host: str, domains) -> bool:
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
+def blocked_reason(url: str, resource_type: str) -> Optional[str]:
+    """Why the network filter blocks a request, None if it is let through
+
+    Args:
+        url (str): URL of the request
+        resource_type (str): Resource type playwright gives the request
+
+    Returns:
+        Optional[str]: trackers, images, media, third party or the blocked resource type
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ("file", "data"):  # saved pages, like the capture benchmark uses
+        return None
+    host = parsed.hostname or ""
+    if _on_host(host, TRACKER_HOSTS):
+        return "trackers"
+    if resource_type == "image" and not _on_host(host, IMAGE_HOSTS):
+        return "images"
+    if resource_type == "media":
+        return "media"
+    if not _on_host(host, ALLOWED_HOSTS):
+        return "third party"
+    if resource_type not in ALLOWED_TYPES:
+        return resource_type
+    return None
+
+
+class NetworkFilter:
+    """Lets through only the requests the cards need, counting what it blocks and loads.
+
+    The filter intercepts every request, which turns off the HTTP cache of the browser: the
+    scripts and styles of reddit are loaded again for every page, instead of once per browser.
+    Blocking the post media and trackers usually saves more than that, but not on threads
+    without media. report prints the time until the thread was ready either way, so the two can
+    be compared with the block_resources setting.
+
+    Args:
+        block (Optional): Whether requests are filtered, only the ready time is reported if not
+    """
+
+    def __init__(self, block: bool = True):
+        self.block = block
+        self.reset()
+
+    def reset(self):
+        self.allowed = 0
+        self.loaded = 0  # bytes, from the Content-Length of the responses
+        self.blocked = Counter()
+
+    async def handle(self, route):
+        reason = blocked_reason(route.request.url, route.request.resource_type)
+        if reason is None:
+            self.allowed += 1
+            await route.continue_()
+        else:
+            self.blocked[reason] += 1
+            await route.abort("blockedbyclient")
+
+    def count_response(self, response):
+        self.loaded += int(response.headers.get("content-length") or 0)
+
+    def report(self, seconds: float):
+        """Prints the requests blocked and the bytes loaded since the last reset"""
+        if not self.block:
+            print_substep(
+                f"Thread ready in {seconds:.1f}s, with the browser cache and nothing blocked",
+                style="bold blue",
+            )
+            return
+        blocked = ", ".join(f"{count} {reason}" for reason, count in self.blocked.most_common())
+        print_substep(
+            f"Thread ready in {seconds:.1f}s. Blocked {sum(self.blocked.values())} of "
+            f"{sum(self.blocked.values()) + self.allowed} requests ({blocked or 'none'}), "
+            f"loaded {self.loaded / 1024 ** 2:.1f} MB",
+            style="bold blue",
+        )
+
+
+class BrowserPool:
+    """Keeps Chromium running between videos, with a context per theme that already has its cookies.
+
+    The browser is driven with the async API of playwright from an event loop on a thread of its
+    own, so a job can work on several pages at once. The browser is either launched by the pool or,
+    if browser_endpoint is set, a shared one that several processes connect to over CDP
+    (start it with python -m utils.browser).
+
+    Args:
+        endpoint (Optional): CDP endpoint of a running browser, launches one if empty
+        recycle (Optional): Number of jobs after which the browser is restarted, to free the
+            memory Chromium piles up. Shared browsers only get their contexts recreated
+        block (Optional): Whether the contexts only load what the cards need, see NetworkFilter
+        timeout (Optional): Seconds a navigation or screenshot may take before it fails
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "",
+        recycle: int = DEFAULT_RECYCLE,
+        block: bool = True,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.endpoint = endpoint
+        self.recycle = recycle
+        self.network = NetworkFilter(block)
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="browser", daemon=True)
+        self.thread.start()
+        self.lock = None
+        self.playwright = None
+        self.browser = None
+        self.contexts: Dict[str, object] = {}
+        self.jobs = 0
+
+    def warm(self) -> Future:
+        """Starts the browser in the background, so it is ready when the first job comes in"""
+        return asyncio.run_coroutine_threadsafe(self._locked(self._ensure), self.loop)
+
+    def run(self, job: Callable[..., Awaitable[T]], *args) -> T:
+        """Runs the coroutine job(context, *args) in the browser thread, with the context of the theme.
+
+        Jobs run one after the other. The browser is checked before the job and restarted if it
+        isn't connected anymore. If the browser fails during the job, it is restarted and the job
+        runs once more.
+
+        Args:
+            job (Callable[..., Awaitable[T]]): Makes the screenshots with the context it gets
+            *args: Passed on to job
+
+        Returns:
+            T: What job returned
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._locked(self._run, job, *args), self.loop
+        ).result()
+
+    def close(self):
+        """Closes the browser, or disconnects from the shared one, and stops the browser thread"""
+        asyncio.run_coroutine_threadsafe(self._locked(self._stop), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _locked(self, func: Callable[..., Awaitable[T]], *args) -> T:
+        if self.lock is None:
+            self.lock = asyncio.Lock()  # made here, so it belongs to the loop of the pool
+        async with self.lock:
+            return await func(*args)
+
+    async def _run(self, job: Callable[..., Awaitable[T]], *args) -> T:
+        try:
+            return await self._attempt(job, *args)
+        except Error:
+            if self.browser is None or self.browser.is_connected():
+                raise
+            print_substep("The browser crashed, restarting it...", style="bold red")
+            await self._stop()
+            return await self._attempt(job, *args)
+
+    async def _attempt(self, job: Callable[..., Awaitable[T]], *args) -> T:
+        await self._ensure()
+        context = self.contexts[settings.config["settings"]["theme"] or "dark"]
+        self.network.reset()
+        try:
+            return await job(context, *args)
+        finally:
+            self.jobs += 1
+            for page in list(context.pages):  # pages left open by the job would leak
+                try:
+                    await page.close()
+                except Error:
+                    pass
+
+    async def _ensure(self):
+        if self.browser is not None and not self.browser.is_connected():
+            print_substep("The browser is gone, restarting it...", style="bold red")
+            await self._stop()
+        if self.browser is not None and self.jobs >= self.recycle:
+            print_substep(f"Restarting the browser after {self.jobs} videos...")
+            await self._stop()
+        if self.browser is not None:
+            return
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        if self.endpoint:
+            print_substep(f"Connecting to the browser at {self.endpoint}...")
+            self.browser = await self.playwright.chromium.connect_over_cdp(self.endpoint)
+        else:
+            print_substep("Launching Headless Browser...")
+            self.browser = await self.playwright.chromium.launch()
+        for theme, cookie_file in COOKIE_FILES.items():
+            context = await self.browser.new_context(viewport=VIEWPORT)
+            context.set_default_timeout(self.timeout * 1000)
+            if self.network.block:  # this turns off the HTTP cache, see NetworkFilter
+                await context.route("**/*", self.network.handle)
+                context.on("response", self.network.count_response)
+            with open(cookie_file, encoding="utf-8") as f:
+                await context.add_cookies(json.load(f))  # load preference cookies
+            self.contexts[theme] = context
+        self.jobs = 0
+
+    async def _stop(self):
+        for context in self.contexts.values():
+            try:
+                await context.close()
+            except Error:
+                pass
+        self.contexts = {}
+        if self.browser is not None:
+            try:
+                await self.browser.close()  # only disconnects from a shared browser
+            except Error:
+                pass
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+
+_pool: Optional[BrowserPool] = None
+_lock = threading.Lock()
+
+
+def browser_pool() -> BrowserPool:
+    """The browser pool of this process, created on first use from the screenshot settings"""
+    global _pool
+    with _lock:
+        if _pool is None:
+            config = settings.config["settings"]["screenshots"]
+            _pool = BrowserPool(
+                str(config["browser_endpoint"] or ""),
+                int(config["browser_recycle"] or DEFAULT_RECYCLE),
+                config["block_resources"] is not False,
+                float(config["navigation_timeout"] or DEFAULT_TIMEOUT),
+            )
+        return _pool
+
+
+def close_browser_pool():
+    """Closes the browser pool of this process, if it has one"""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+if __name__ == "__main__":
+    # Runs a browser that other processes share by setting browser_endpoint to the printed URL
+    import sys
+
+    async def serve(port: int):
+        async with async_playwright() as p:
+            await p.chromium.launch(args=[f"--remote-debugging-port={port}"])
+            print(f"Shared browser running, set browser_endpoint to http://localhost:{port}")
+            await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve(int(sys.argv[1]) if len(sys.argv) > 1 else 9222))
+    except KeyboardInterrupt:
+        pass
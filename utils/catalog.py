@@ -0,0 +1,83 @@
+import os
+import subprocess
+import threading
+from fractions import Fraction
+from typing import Dict, List
+
+import ffmpeg
+
+from utils.console import print_substep
+from utils.shared import read_json, update_json
+
+CATALOG_FILE = "assets/backgrounds/catalog.json"
+
+_lock = threading.Lock()
+
+
+def load_catalog() -> Dict[str, dict]:
+    return read_json(CATALOG_FILE)
+
+
+def update_entry(path: str, **fields):
+    """Sets fields of the catalog entry of the video, creating the entry if there is none"""
+    with _lock:
+        update_json(CATALOG_FILE, lambda catalog: catalog.setdefault(path, {}).update(fields))
+
+
+def get_entry(path: str) -> dict:
+    """The catalog entry of a video, probed only when the video is new or changed.
+
+    Args:
+        path (str): Path of the video
+
+    Returns:
+        dict: duration and fps (float), width and height (int), keyframes (list of timestamps)
+    """
+    stat = os.stat(path)
+    entry = load_catalog().get(path, {})
+    if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        if "keyframes" in entry:
+            return entry
+    print_substep(f"Indexing the keyframes of {path}...")
+    update_entry(path, size=stat.st_size, mtime=stat.st_mtime, **probe_video(path))
+    return load_catalog()[path]
+
+
+def probe_video(path: str) -> dict:
+    """Reads the metadata and keyframe timestamps of the first video stream of a file"""
+    probe = ffmpeg.probe(path)
+    video = next(s for s in probe["streams"] if s["codec_type"] == "video")
+    return {
+        "duration": float(probe["format"]["duration"]),
+        "fps": float(Fraction(video["r_frame_rate"])),
+        "width": int(video["width"]),
+        "height": int(video["height"]),
+        "keyframes": probe_keyframes(path),
+    }
+
+
+def probe_keyframes(path: str) -> List[float]:
+    """Keyframe timestamps of the first video stream, read from the packet flags without decoding"""
+    output = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,flags",
+            "-of",
+            "csv=p=0",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    keyframes = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
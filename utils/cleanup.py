@@ -1,29 +1,19 @@
 import os
+import shutil
 from os.path import exists
 
-
-def _listdir(d):  # listdir with full path
-    return [os.path.join(d, f) for f in os.listdir(d)]
+from utils.workdir import job_dir
 
 
 def cleanup(id) -> int:
-    """Deletes all temporary assets in assets/temp
+    """Deletes the work directory of the job making the video of the thread, and nothing else
 
     Returns:
         int: How many files were deleted
     """
-    if exists("./assets/temp"):
-        count = 0
-        files = [f for f in os.listdir(".") if f.endswith(".mp4") and "temp" in f.lower()]
-        count += len(files)
-        for f in files:
-            os.remove(f)
-        REMOVE_DIRS = [f"./assets/temp/{id}/mp3/", f"./assets/temp/{id}/png/"]
-        files_to_remove = list(map(_listdir, REMOVE_DIRS))
-        for directory in files_to_remove:
-            for file in directory:
-                count += 1
-                os.remove(file)
-        return count
-
-    return 0
+    path = job_dir(id)
+    if not exists(path):
+        return 0
+    count = sum(len(files) for _, _, files in os.walk(path))
+    shutil.rmtree(path, ignore_errors=True)
+    return count
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.console import print_substep
+from utils.ratelimit import backoff
+
+CHUNK_SIZE = 8 * 1024 * 1024  # bytes per ranged request
+MAX_RETRIES = 5
+
+
+def download(
+    url: str,
+    path: str,
+    workers: int = 4,
+    verify: Optional[Callable[[str], bool]] = None,
+    chunk_size: int = CHUNK_SIZE,
+):
+    """Downloads a file in parallel ranges, resuming an interrupted download of it.
+
+    The file is written to path.part, and the chunks that are finished are listed in
+    path.part.json, so a later call only fetches the missing chunks. Once every chunk is there,
+    the size (and verify, if given) is checked and the file is renamed to path. A file at path is
+    therefore always complete. Servers that don't support ranges are downloaded in one stream.
+
+    Args:
+        url (str): URL to download
+        path (str): Path to save the file to
+        workers (Optional): Number of ranges fetched at the same time
+        verify (Optional): Checks the finished .part file, the download fails if it returns False
+        chunk_size (Optional): Bytes per ranged request
+
+    Raises:
+        ValueError: The finished file has the wrong size or didn't pass verify
+    """
+    part, state_file = f"{path}.part", f"{path}.part.json"
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    with _get(session, url, {"Range": "bytes=0-0"}, stream=True, timeout=30) as response:
+        ranged = response.status_code == 206
+        size = int(response.headers["Content-Range"].rsplit("/", 1)[1]) if ranged else None
+
+    start = time.perf_counter()
+    if ranged:
+        _download_ranges(session, url, part, state_file, size, workers, chunk_size)
+    else:
+        # without a Content-Length the size can't be checked, only verify can catch a truncation
+        size = _download_stream(session, url, part) or os.path.getsize(part)
+
+    if os.path.getsize(part) != size:
+        raise ValueError(f"{part} is {os.path.getsize(part)} bytes, expected {size}")
+    if verify is not None and not verify(part):
+        Path(part).unlink()
+        Path(state_file).unlink(missing_ok=True)
+        raise ValueError(f"{url} didn't download to a valid file")
+    os.replace(part, path)
+    Path(state_file).unlink(missing_ok=True)
+    seconds = time.perf_counter() - start
+    print_substep(
+        f"Downloaded {size / 1024 ** 2:.0f} MB in {seconds:.1f}s "
+        f"({size / 1024 ** 2 / max(seconds, 1e-3):.1f} MB/s)",
+        style="bold green",
+    )
+
+
+def _download_ranges(
+    session: requests.Session,
+    url: str,
+    part: str,
+    state_file: str,
+    size: int,
+    workers: int,
+    chunk_size: int,
+):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if state.get("size") != size or state.get("chunk_size") != chunk_size:
+        state = {"size": size, "chunk_size": chunk_size, "done": []}
+    if not Path(part).is_file():
+        state["done"] = []
+    with open(part, "ab") as f:  # create it without truncating what is already there
+        f.truncate(size)
+
+    chunks = [i for i in range(-(-size // chunk_size)) if i not in state["done"]]
+    if state["done"]:
+        print_substep(
+            f"Resuming the download, {len(chunks)} of {-(-size // chunk_size)} chunks left"
+        )
+    lock = threading.Lock()
+
+    def fetch(i: int):
+        first, last = i * chunk_size, min(size, (i + 1) * chunk_size) - 1
+        response = _get(
+            session,
+            url,
+            {"Range": f"bytes={first}-{last}"},
+            lambda r: r.status_code == 206 and len(r.content) == last - first + 1,
+            timeout=60,
+        )
+        with open(part, "r+b") as f:
+            f.seek(first)
+            f.write(response.content)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, i): i for i in chunks}
+        for future in as_completed(futures):
+            future.result()
+            with lock:
+                state["done"].append(futures[future])
+                with open(state_file, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+
+
+def _get(
+    session: requests.Session,
+    url: str,
+    headers: dict,
+    validate: Callable[[requests.Response], bool] = lambda response: True,
+    **kwargs,
+) -> requests.Response:
+    """GET with retries, for connection errors, error statuses and responses validate rejects"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = session.get(url, headers=headers, **kwargs)
+            response.raise_for_status()
+            if not validate(response):
+                raise requests.RequestException(f"Unexpected response for {headers} from {url}")
+            return response
+        except requests.RequestException:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(backoff(attempt))
+
+
+def _download_stream(session: requests.Session, url: str, part: str) -> Optional[int]:
+    """Downloads url to part in one request, returns the size the server announced, if any"""
+    with _get(session, url, {}, stream=True, timeout=60) as response:
+        with open(part, "wb") as f:
+            for block in response.iter_content(1024 * 1024):
+                f.write(block)
+        if "Content-Encoding" in response.headers:  # the length is that of the encoded body
+            return None
+        length = response.headers.get("Content-Length")
+        return int(length) if length else None
@@ -0,0 +1,162 @@
+import os
+import subprocess
+import time
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from rich.table import Table
+
+from utils import settings
+from utils.console import console, print_step, print_substep
+
+# Supported encoder profiles. Can add/remove profiles here....
+# <key>-<value> : key -> used as keyword for TOML file. value -> profile
+# Format (value):
+# 1. hwaccel: ffmpeg -hwaccel used to decode the inputs, None to decode on the CPU
+# 2. output_args: ffmpeg output options, "c:v" is the encoder that has to be available
+encoder_profiles = {
+    "nvenc-hevc": {
+        "hwaccel": "cuda",
+        "output_args": {"c:v": "hevc_nvenc", "preset": "fast", "tier": "high", "b:v": "20M"},
+    },
+    "nvenc-h264": {
+        "hwaccel": "cuda",
+        "output_args": {"c:v": "h264_nvenc", "preset": "fast", "b:v": "20M"},
+    },
+    "x264": {
+        "hwaccel": None,
+        "output_args": {"c:v": "libx264", "preset": "veryfast", "crf": 20, "pix_fmt": "yuv420p"},
+    },
+    "x265": {
+        "hwaccel": None,
+        "output_args": {
+            "c:v": "libx265",
+            "preset": "faster",
+            "crf": 23,
+            "pix_fmt": "yuv420p",
+            "tag:v": "hvc1",
+        },
+    },
+}
+
+# Order in which "auto" tries the profiles, the first one that works on this machine is used.
+AUTO_ORDER = ["nvenc-hevc", "nvenc-h264", "x264", "x265"]
+
+
+def _ffmpeg(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", *args], capture_output=True, text=True, check=False
+    )
+
+
+@lru_cache(maxsize=None)
+def probe_encoders() -> List[str]:
+    """Lists the video encoders compiled into the local ffmpeg (ffmpeg -encoders)"""
+    lines = _ffmpeg("-encoders").stdout.split(" ------\n")[-1].splitlines()
+    return [line.split()[1] for line in lines if line.startswith(" V")]
+
+
+@lru_cache(maxsize=None)
+def probe_hwaccels() -> List[str]:
+    """Lists the hardware decoders compiled into the local ffmpeg (ffmpeg -hwaccels)"""
+    lines = _ffmpeg("-hwaccels").stdout.splitlines()
+    return [line.strip() for line in lines[1:] if line.strip()]
+
+
+@lru_cache(maxsize=None)
+def profile_available(name: str) -> bool:
+    """Checks if a profile can be used on this machine.
+
+    Being compiled in is not enough for the hardware encoders (NVENC is listed on GPU-less machines
+    as well), so every candidate encodes a few blank frames before it is accepted.
+
+    Args:
+        name (str): Key of the profile in encoder_profiles
+
+    Returns:
+        bool: Whether the encoder (and hwaccel) of the profile work
+    """
+    profile = encoder_profiles[name]
+    encoder = profile["output_args"]["c:v"]
+    if encoder not in probe_encoders():
+        return False
+    if profile["hwaccel"] and profile["hwaccel"] not in probe_hwaccels():
+        return False
+    test = _ffmpeg(
+        "-f", "lavfi", "-i", "color=size=256x256:duration=0.2",
+        "-c:v", encoder, "-f", "null", "-",
+    )  # fmt: skip
+    return test.returncode == 0
+
+
+def get_threads() -> int:
+    """Gets the number of ffmpeg threads, either from the config or from the available cores"""
+    threads = settings.config["settings"]["render"]["threads"]
+    if threads:
+        return int(threads)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def get_encoder_profile() -> Tuple[str, Dict, Dict, int]:
+    """Picks the encoder profile used for the final render.
+
+    The profile set in the config is used if it works on this machine, otherwise the first working
+    profile of AUTO_ORDER is picked.
+
+    Returns:
+        Tuple[str, Dict, Dict, int]: name of the profile, ffmpeg input args, ffmpeg output args, threads
+    """
+    choice = str(settings.config["settings"]["render"]["encoder"]).casefold()
+    if choice in encoder_profiles and not profile_available(choice):
+        print_substep(f"Encoder profile {choice} is not available on this machine.", style="red")
+    if choice not in encoder_profiles or not profile_available(choice):
+        choice = next((name for name in AUTO_ORDER if profile_available(name)), None)
+        if choice is None:
+            raise RuntimeError("ffmpeg has none of the supported encoders, please reinstall ffmpeg")
+
+    profile = encoder_profiles[choice]
+    input_args = {"hwaccel": profile["hwaccel"]} if profile["hwaccel"] else {}
+    threads = get_threads()
+    print_substep(f"Using the {choice} encoder profile with {threads} threads", style="bold blue")
+    return choice, input_args, dict(profile["output_args"]), threads
+
+
+def calibrate(frames: int = 240) -> Dict[str, float]:
+    """Encodes a 1080x1920 test pattern with every available profile and reports the speed.
+
+    Args:
+        frames (int): Number of frames to encode per profile
+
+    Returns:
+        Dict[str, float]: Encode speed in frames per second, by profile name
+    """
+    print_step("Calibrating encoder profiles...")
+    threads = get_threads()
+    results = {}
+    for name, profile in encoder_profiles.items():
+        if not profile_available(name):
+            print_substep(f"Skipping {name}, not available on this machine")
+            continue
+        output_args = [
+            arg for key, value in profile["output_args"].items() for arg in (f"-{key}", str(value))
+        ]
+        start = time.perf_counter()
+        _ffmpeg(
+            "-f", "lavfi", "-i", "testsrc2=size=1080x1920:rate=30",
+            "-frames:v", str(frames), *output_args, "-threads", str(threads), "-f", "null", "-",
+        )  # fmt: skip
+        results[name] = frames / (time.perf_counter() - start)
+
+    table = Table("Profile", "Encoder", "Frames per second")
+    for name, fps in sorted(results.items(), key=lambda item: item[1], reverse=True):
+        table.add_row(name, encoder_profiles[name]["output_args"]["c:v"], f"{fps:.1f}")
+    console.print(table)
+    return results
+
+
+if __name__ == "__main__":
+    settings.check_toml("utils/.config.template.toml", "config.toml")
+    calibrate()
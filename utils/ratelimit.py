@@ -0,0 +1,178 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, TypeVar
+
+import requests
+
+from utils import settings
+from utils.console import print_substep
+
+T = TypeVar("T")
+
+# requests per second each TTS module may send when its *_rate_limit setting is 0
+DEFAULT_RATES = {"TikTok": 5.0, "StreamlabsPolly": 2.0, "AWSPolly": 8.0, "GTTS": 5.0}
+RATE_SETTINGS = {
+    "TikTok": "tiktok_rate_limit",
+    "StreamlabsPolly": "streamlabs_polly_rate_limit",
+    "AWSPolly": "aws_polly_rate_limit",
+    "GTTS": "gtts_rate_limit",
+}
+MAX_RETRIES = 5
+MAX_BACKOFF = 60  # seconds
+
+
+class TokenBucket:
+    """Lets through rate requests per second on average, with bursts of up to burst requests.
+
+    Args:
+        rate (float): Tokens added per second
+        burst (int): Maximum number of tokens the bucket holds
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes a token, waiting for one if the bucket is empty or paused.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1  # reserve the token now, the wait below pays it back
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """Stops handing out tokens for the given number of seconds"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+
+
+buckets: Dict[str, TokenBucket] = {}
+metrics: Dict[str, Dict[str, float]] = {}
+_lock = threading.Lock()
+
+
+def get_bucket(provider: str) -> TokenBucket:
+    with _lock:
+        if provider not in buckets:
+            setting = RATE_SETTINGS.get(provider)
+            rate = settings.config["settings"]["tts"][setting] if setting else 0
+            rate = float(rate or DEFAULT_RATES.get(provider, 1.0))
+            buckets[provider] = TokenBucket(rate, max(1, int(rate)))
+            metrics[provider] = {
+                "requests": 0,
+                "throttled": 0,
+                "retries": 0,
+                "failures": 0,
+                "waited": 0.0,
+            }
+        return buckets[provider]
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds the server asked us to wait, from the Retry-After or X-RateLimit-Reset header"""
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+    value = response.headers.get("X-RateLimit-Reset")
+    if value:
+        try:
+            reset = float(value)
+        except ValueError:
+            return None
+        # either a unix timestamp or a number of seconds
+        return max(reset - time.time(), 0) if reset > 1e9 else reset
+    return None
+
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(MAX_BACKOFF, 2**attempt))
+
+
+def limited(
+    provider: str,
+    request: Callable[[], T],
+    should_retry: Optional[Callable[[Exception], bool]] = None,
+) -> T:
+    """Sends a request through the token bucket of the provider, retrying it when it fails.
+
+    Responses with status 429 or 5xx are retried after the time the server asks for, or with
+    jittered exponential backoff if it doesn't say. Exceptions for which should_retry is true are
+    retried with backoff.
+
+    Args:
+        provider (str): Name of the TTS module sending the request
+        request (Callable[[], T]): Sends the request and returns its result
+        should_retry (Optional): Whether an exception raised by request is worth retrying.
+            Defaults to retrying the exceptions of requests
+
+    Returns:
+        T: What request returned, the last response if it never succeeded
+    """
+    should_retry = should_retry or (lambda e: isinstance(e, requests.RequestException))
+    bucket = get_bucket(provider)
+    for attempt in range(MAX_RETRIES + 1):
+        _count(provider, "waited", bucket.acquire())
+        _count(provider, "requests")
+        if attempt:
+            _count(provider, "retries")
+        try:
+            result = request()
+        except Exception as e:
+            if not should_retry(e) or attempt == MAX_RETRIES:
+                _count(provider, "failures")
+                raise
+            bucket.pause(backoff(attempt))
+            continue
+        if not isinstance(result, requests.Response) or (
+            result.status_code != 429 and result.status_code < 500
+        ):
+            return result
+        if result.status_code == 429:
+            _count(provider, "throttled")
+        if attempt == MAX_RETRIES:
+            _count(provider, "failures")
+            return result
+        wait = retry_after(result)
+        bucket.pause(backoff(attempt) if wait is None else wait)
+    return result
+
+
+def _count(provider: str, metric: str, value: float = 1):
+    with _lock:
+        metrics[provider][metric] += value
+
+
+def report(provider: str):
+    """Prints the request metrics of the provider"""
+    stats = metrics.get(provider)
+    if not stats or not stats["requests"]:
+        return
+    print_substep(
+        f"{provider}: {stats['requests']:.0f} requests, {stats['throttled']:.0f} rate limited, "
+        f"{stats['retries']:.0f} retries, {stats['failures']:.0f} failed, "
+        f"{stats['waited']:.1f}s waited for the rate limit",
+        style="bold blue",
+    )
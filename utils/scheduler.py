@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from rich.table import Table
+
+from utils.console import console
+
+
+class Stage(NamedTuple):
+    """A step of the pipeline.
+
+    Args:
+        name (str): Name of the stage, other stages refer to it in their requires
+        func (Callable): Runs the stage, it gets the results of the required stages as arguments
+        requires (Tuple[str, ...]): Names of the stages that have to be finished before this one
+    """
+
+    name: str
+    func: Callable
+    requires: Tuple[str, ...] = ()
+
+
+def run_stages(
+    stages: List[Stage], timings: Dict[str, Tuple[float, float]] = None
+) -> Dict[str, Any]:
+    """Runs the stages in threads, each one as soon as the stages it requires are finished.
+
+    Args:
+        stages (List[Stage]): The stages to run
+        timings (Optional): Filled with the start and end of every stage, in seconds since the start
+
+    Returns:
+        Dict[str, Any]: The result of every stage by name
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        missing = set(stage.requires) - names
+        if missing:
+            raise ValueError(f"Stage {stage.name} requires unknown stages {missing}")
+
+    results = {}
+    timings = {} if timings is None else timings
+    pending = list(stages)
+    running = {}
+    start = time.perf_counter()
+
+    def timed(stage: Stage):
+        began = time.perf_counter()
+        try:
+            return stage.func(*[results[name] for name in stage.requires])
+        finally:
+            timings[stage.name] = (began - start, time.perf_counter() - start)
+
+    pool = ThreadPoolExecutor(max_workers=len(stages))
+    try:
+        while pending or running:
+            for stage in [s for s in pending if all(name in results for name in s.requires)]:
+                pending.remove(stage)
+                running[pool.submit(timed, stage)] = stage
+            if not running:
+                raise ValueError(f"Stages {[s.name for s in pending]} have circular requirements")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                results[stage.name] = future.result()  # re-raises the exception of a failed stage
+    except BaseException:
+        # a failed stage or Ctrl-C, raise it now instead of after the stages still running
+        for future in running:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    print_timings(stages, timings)
+    return results
+
+
+def critical_path(stages: List[Stage], timings: Dict[str, Tuple[float, float]]) -> List[str]:
+    """Follows the stage that finished last back through the requirement that held it up the longest"""
+    by_name = {stage.name: stage for stage in stages}
+    name = max(timings, key=lambda n: timings[n][1])
+    path = [name]
+    while by_name[name].requires:
+        name = max(by_name[name].requires, key=lambda n: timings[n][1])
+        path.insert(0, name)
+    return path
+
+
+def print_timings(stages: List[Stage], timings: Dict[str, Tuple[float, float]]):
+    """Prints when every stage ran and how long it took, marking the critical path."""
+    path = critical_path(stages, timings)
+    table = Table("Stage", "Started", "Finished", "Took", "Critical path", title="Stage timings")
+    for stage in sorted(stages, key=lambda s: timings[s.name][0]):
+        began, finished = timings[stage.name]
+        table.add_row(
+            stage.name,
+            f"{began:.1f}s",
+            f"{finished:.1f}s",
+            f"{finished - began:.1f}s",
+            "✔" if stage.name in path else "",
+        )
+    console.print(table)
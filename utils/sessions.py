@@ -0,0 +1,21 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import settings
+
+
+def pooled_session(pool_size: int) -> requests.Session:
+    """Creates a session that keeps its connections alive and reuses them for later requests.
+
+    Args:
+        pool_size (int): Connections kept per host, the http_pool_size setting overrides it
+
+    Returns:
+        requests.Session: The session, safe to share between the TTS threads
+    """
+    pool_size = int(settings.config["settings"]["tts"]["http_pool_size"] or pool_size)
+    adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
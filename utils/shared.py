@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # LK_LOCK gives up after 10 seconds
+                time.sleep(0.1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Holds an exclusive lock on path.lock, so only one process at a time changes path"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{path}.lock", "a+") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def temp_path(path: str, suffix: str = "") -> str:
+    """A new, empty file next to path that no other writer (thread or process) uses.
+
+    The name ends with suffix, ffmpeg picks the output format by the extension.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fd, temp = tempfile.mkstemp(
+        prefix=f"{Path(path).name}.{os.getpid()}.", suffix=f".tmp{suffix}", dir=Path(path).parent
+    )
+    os.close(fd)
+    return temp
+
+
+def read_json(path: str, empty: Callable[[], Any] = dict) -> Any:
+    """Reads a JSON file, empty() if it is missing or not valid JSON"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return empty()
+
+
+def write_json(path: str, data: dict, **kwargs):
+    """Writes the file to a temp file of its own and renames it, so readers never see half of it"""
+    temp = temp_path(path)
+    try:
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(data, f, **kwargs)
+        os.replace(temp, path)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
+
+
+def update_json(
+    path: str, update: Callable[[Any], T], empty: Callable[[], Any] = dict, **kwargs
+) -> T:
+    """Changes a JSON file that other processes change as well, without losing their changes.
+
+    The file is read again under a file lock, changed in place by update and written back before
+    the lock is released.
+
+    Args:
+        path (str): Path of the JSON file
+        update (Callable[[Any], T]): Changes the current content of the file
+        empty (Optional): Makes the content of a missing file, dict by default
+        **kwargs: Passed on to json.dump
+
+    Returns:
+        T: What update returned
+    """
+    with file_lock(path):
+        data = read_json(path, empty)
+        result = update(data)
+        write_json(path, data, **kwargs)
+    return result
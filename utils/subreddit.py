@@ -1,8 +1,7 @@
-import json
-from os.path import exists
-
 from utils import settings
 from utils.console import print_substep
+from utils.shared import read_json
+from utils.videos import VIDEOS_FILE
 
 
 def get_subreddit_undone(submissions: list, subreddit, times_checked=0):
@@ -16,11 +15,7 @@ def get_subreddit_undone(submissions: list, subreddit, times_checked=0):
         Any: The submission that has not been done
     """
     # recursively checks if the top submission in the list was already done.
-    if not exists("./video_creation/data/videos.json"):
-        with open("./video_creation/data/videos.json", "w+") as f:
-            json.dump([], f)
-    with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
-        done_videos = json.load(done_vids_raw)
+    done_videos = read_json(VIDEOS_FILE, list)
     for submission in submissions:
         if already_done(done_videos, submission):
             continue
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, List
+
+from TTS.chunker import split_text
+from utils import settings
+from utils.console import print_substep
+from utils.shared import update_json
+
+CACHE_FILE = "assets/translations.json"
+MAX_ENTRIES = 20000  # the oldest translations are dropped past this
+MAX_REQUEST_CHARS = 4500  # the translation APIs refuse texts longer than 5000 characters
+
+
+def google_translator(text: str, lang: str) -> str:
+    import translators as ts  # connects to the translation servers when it is imported
+
+    return ts.google(text, to_language=lang)
+
+
+# called with (text, language), replace it to translate with another service
+translator: Callable[[str, str], str] = google_translator
+
+_cache: Dict[str, str] = {}
+_loaded = False
+_lock = threading.Lock()
+
+
+def _key(text: str, lang: str) -> str:
+    return hashlib.sha256(f"{lang}\0{text}".encode()).hexdigest()
+
+
+def _load():
+    global _loaded
+    if _loaded:
+        return
+    try:
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            _cache.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    _loaded = True
+
+
+def _save():
+    def merge(cache: Dict[str, str]):
+        # keeps what other processes translated in the meantime
+        cache.update(_cache)
+        for key in list(cache)[: max(0, len(cache) - MAX_ENTRIES)]:
+            del cache[key]
+        _cache.clear()
+        _cache.update(cache)
+
+    update_json(CACHE_FILE, merge, ensure_ascii=False)
+
+
+def translate(texts: List[str], lang: str) -> List[str]:
+    """Translates the texts, sending the ones that aren't cached in as few requests as possible.
+
+    Texts are sent one per line, so a request holds as many texts as fit in MAX_REQUEST_CHARS.
+    Requests that come back with a different number of lines are retried one text at a time.
+    Texts longer than a request are translated in chunks.
+
+    Args:
+        texts (List[str]): Texts to translate
+        lang (str): Language code to translate them to
+
+    Returns:
+        List[str]: The translations, in the order of texts
+    """
+    with _lock:
+        _load()
+        missing = list(dict.fromkeys(t for t in texts if t.strip() and _key(t, lang) not in _cache))
+    translated = {}
+    if missing:
+        print_substep(f"Translating {len(missing)} texts...")
+        batch = []
+        for text in missing:
+            if len(text) > MAX_REQUEST_CHARS:
+                chunks = split_text(text, MAX_REQUEST_CHARS)
+                translated[text] = " ".join(translator(chunk, lang) for chunk in chunks)
+                continue
+            if sum(len(t) + 1 for t in batch) + len(text) > MAX_REQUEST_CHARS:
+                translated.update(_translate_batch(batch, lang))
+                batch = []
+            batch.append(text)
+        translated.update(_translate_batch(batch, lang))
+        with _lock:
+            for text, translation in translated.items():
+                _cache[_key(text, lang)] = translation
+            _save()
+    with _lock:  # _save replaces the content of _cache
+        return [
+            translated[text] if text in translated else _cache.get(_key(text, lang), text)
+            for text in texts
+        ]
+
+
+def _translate_batch(batch: List[str], lang: str) -> Dict[str, str]:
+    if not batch:
+        return {}
+    lines = [" ".join(text.split()) for text in batch]  # one line per text
+    translated = translator("\n".join(lines), lang).split("\n")
+    if len(translated) != len(batch):
+        translated = [translator(line, lang) for line in lines]
+    return dict(zip(batch, translated))
+
+
+def get_languages() -> List[str]:
+    """The languages of post_lang, "de+fr" makes a video in each. [""] if post_lang isn't set"""
+    langs = str(settings.config["reddit"]["thread"]["post_lang"] or "").split("+")
+    return [lang.strip() for lang in langs if lang.strip()] or [""]
+
+
+def translate_text(text: str, lang: str = None) -> str:
+    """Translates the text, leaving it as is if there is no language to translate to.
+
+    Args:
+        text (str): Text to translate
+        lang (Optional): Language code, defaults to the first language of post_lang
+    """
+    lang = get_languages()[0] if lang is None else lang
+    return translate([text], lang)[0] if lang else text
+
+
+def translate_thread(reddit_object: dict):
+    """Translates every text of the thread to every language at once, so later calls are cached"""
+    texts = [reddit_object["thread_title"], reddit_object["thread_post"]]
+    texts += [comment["comment_body"] for comment in reddit_object["comments"]]
+    for lang in get_languages():
+        if lang:
+            translate(texts, lang)
@@ -8,6 +8,8 @@ from PIL import ImageFont, Image, ImageDraw, ImageEnhance
 from moviepy.video.VideoClip import VideoClip, ImageClip
 from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
 
+from utils.workdir import job_dir
+
 
 class Video:
     def __init__(self, video: VideoClip, *args, **kwargs):
@@ -18,7 +20,7 @@ class Video:
     @staticmethod
     def _create_watermark(text, redditid, fontsize, opacity=0.5):
         id = re.sub(r"[^\w\s-]", "", redditid["thread_id"])
-        path = f"./assets/temp/{id}/png/watermark.png"
+        path = f"{job_dir(id)}/png/watermark.png"
         width = int(fontsize * len(text))
         height = int(fontsize * len(text) / 2)
         white = (255, 255, 255)
@@ -1,4 +1,3 @@
-import json
 import time
 from typing import Dict
 
@@ -6,6 +5,9 @@ from praw.models import Submission
 
 from utils import settings
 from utils.console import print_step
+from utils.shared import read_json, update_json
+
+VIDEOS_FILE = "./video_creation/data/videos.json"
 
 
 def check_done(
@@ -20,8 +22,7 @@ def check_done(
     Returns:
         Submission|None: Reddit object in args
     """
-    with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
-        done_videos = json.load(done_vids_raw)
+    done_videos = read_json(VIDEOS_FILE, list)
     for video in done_videos:
         if video["id"] == str(redditobj):
             if settings.config["reddit"]["thread"]["post_id"]:
@@ -44,18 +45,19 @@ def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str,
         @param reddit_id:
         @param reddit_title:
     """
-    with open("./video_creation/data/videos.json", "r+", encoding="utf-8") as raw_vids:
-        done_vids = json.load(raw_vids)
+    payload = {
+        "subreddit": subreddit,
+        "id": reddit_id,
+        "time": str(int(time.time())),
+        "background_credit": credit,
+        "reddit_title": reddit_title,
+        "filename": filename,
+    }
+
+    def add(done_vids: list):
+        # another process may have added videos since this one started
         if reddit_id in [video["id"] for video in done_vids]:
             return  # video already done but was specified to continue anyway in the config file
-        payload = {
-            "subreddit": subreddit,
-            "id": reddit_id,
-            "time": str(int(time.time())),
-            "background_credit": credit,
-            "reddit_title": reddit_title,
-            "filename": filename,
-        }
         done_vids.append(payload)
-        raw_vids.seek(0)
-        json.dump(done_vids, raw_vids, ensure_ascii=False, indent=4)
+
+    update_json(VIDEOS_FILE, add, list, ensure_ascii=False, indent=4)
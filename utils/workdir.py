@@ -0,0 +1,19 @@
+import os
+
+from utils import settings
+
+
+def job_dir(id: str) -> str:
+    """The work directory of the job making the video of a thread, in the temp_root setting.
+
+    It is named after the thread and the process, so processes making videos at the same time
+    (even of the same thread) never share one.
+
+    Args:
+        id (str): The sanitized thread id
+
+    Returns:
+        str: Path of the directory, without a trailing slash
+    """
+    root = str(settings.config["settings"]["temp_root"] or "assets/temp").rstrip("/")
+    return f"{root}/{id}-{os.getpid()}"
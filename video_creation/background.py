@@ -1,30 +1,52 @@
+from bisect import bisect_left, bisect_right
+import hashlib
+import os
 from pathlib import Path
 import random
 from random import randrange
 import re
-from typing import Any, Tuple
+import time
+from typing import Any, List, Tuple
 
 
-from moviepy.editor import VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
 from pytube import YouTube
-from pytube.cli import on_progress
+
+import ffmpeg
 
 from utils import settings
+from utils.catalog import get_entry, load_catalog, update_entry
 from utils.CONSTANTS import background_options
 from utils.console import print_step, print_substep
+from utils.download import download
+from utils.encoder import get_encoder_profile
+from utils.shared import read_json, temp_path, update_json
+from utils.workdir import job_dir
+from video_creation.final_video import format_background
+
+PREPARED_DIR = "assets/backgrounds/prepared"
+KEYFRAME_INTERVAL = 1  # seconds between the keyframes of a prepared background
 
 
-def get_start_and_end_times(video_length: int, length_of_clip: int) -> Tuple[int, int]:
+def get_start_and_end_times(
+    video_length: int, length_of_clip: int, keyframes: List[float] = None
+) -> Tuple[float, float]:
     """Generates a random interval of time to be used as the background of the video.
 
     Args:
         video_length (int): Length of the video
         length_of_clip (int): Length of the video to be used as the background
+        keyframes (Optional): Keyframe timestamps of the background, the interval starts on one of
+            them if any is in range, so it can be cut without re-encoding
 
     Returns:
-        tuple[int,int]: Start and end time of the randomized interval
+        tuple[float,float]: Start and end time of the randomized interval
     """
+    if keyframes:
+        lo = bisect_left(keyframes, 180)
+        hi = bisect_right(keyframes, length_of_clip - video_length)
+        if lo < hi:
+            random_time = keyframes[randrange(lo, hi)]
+            return random_time, random_time + video_length
     random_time = randrange(180, int(length_of_clip) - int(video_length))
     return random_time, random_time + video_length
 
@@ -50,44 +72,154 @@ def download_background(background_config: Tuple[str, str, str, Any]):
     Path("./assets/backgrounds/").mkdir(parents=True, exist_ok=True)
     # note: make sure the file name doesn't include an - in it
     uri, filename, credit, _ = background_config
-    if Path(f"assets/backgrounds/{credit}-{filename}").is_file():
-        return
+    path = f"assets/backgrounds/{credit}-{filename}"
+    stream = None
+    if Path(path).is_file():
+        if load_catalog().get(path, {}).get("complete"):
+            return
+        # downloaded before the catalog existed, or left behind by an interrupted download. A
+        # truncated mp4 still has its header and plays, so the size has to match as well
+        try:
+            stream = YouTube(uri).streams.filter(res="1080p").first()
+            expected = stream.filesize
+        except Exception:  # offline, or YouTube changed, the file is all there is to go by
+            stream, expected = None, None
+        if expected is None:
+            if is_playable(path):
+                print_substep("Couldn't check the size of the background video, it plays.")
+                update_entry(path, complete=True, source=uri)
+                return
+        elif os.path.getsize(path) == expected and is_playable(path):
+            update_entry(path, complete=True, source=uri)
+            return
+        print_substep("The background video is incomplete, downloading it again...")
+        Path(path).unlink()
     print_step(
         "We need to download the backgrounds videos. they are fairly large but it's only done once. 😎"
     )
     print_substep("Downloading the backgrounds videos... please be patient 🙏 ")
     print_substep(f"Downloading {filename} from {uri}")
-    YouTube(uri, on_progress_callback=on_progress).streams.filter(res="1080p").first().download(
-        "assets/backgrounds", filename=f"{credit}-{filename}"
-    )
+    stream = stream or YouTube(uri).streams.filter(res="1080p").first()
+    connections = settings.config["settings"]["background"]["download_connections"] or 4
+    download(stream.url, path, workers=int(connections), verify=is_playable)
+    update_entry(path, complete=True, source=uri)
     print_substep("Background video downloaded successfully! 🎉", style="bold green")
 
 
-def chop_background_video(background_config: Tuple[str, str, str, Any], video_length: int, reddit_object: dict):
-    """Generates the background footage to be used in the video and writes it to assets/temp/background.mp4
+def is_playable(path: str) -> bool:
+    """Whether the file is a video ffmpeg can read, with a duration"""
+    try:
+        probe = ffmpeg.probe(path)
+    except ffmpeg.Error:
+        return False
+    streams = [s for s in probe["streams"] if s["codec_type"] == "video"]
+    return bool(streams) and float(probe["format"].get("duration", 0)) > 0
+
+
+def source_hash(path: str) -> str:
+    """SHA-256 of a background file, only hashed again when its size or modification time changes"""
+    stat = os.stat(path)
+    index_file = f"{PREPARED_DIR}/sources.json"
+    entry = read_json(index_file).get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry["sha256"]
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256.hexdigest()}
+    update_json(index_file, lambda index: index.update({path: entry}), indent=4)
+    return entry["sha256"]
+
+
+def prepare_background(background_config: Tuple[str, str, str, Any]) -> str:
+    """Transcodes the background once into vertical footage the renderer uses as it is.
+
+    The prepared file is scaled and cropped to 1080x1920, has no audio and a keyframe every
+    KEYFRAME_INTERVAL seconds, so it can be cut without re-encoding. It is cached in
+    assets/backgrounds/prepared under the hash of the source file.
+
+    Args:
+        background_config (Tuple[str, str, str, Any]): Current background configuration
+
+    Returns:
+        str: Path of the video to cut the background from, the source if preparing is turned off
+    """
+    source = f"assets/backgrounds/{background_config[2]}-{background_config[1]}"
+    # missing from older configs, which read as an empty dict
+    if settings.config["settings"]["background"]["prepare"] is False:
+        return source
+    Path(PREPARED_DIR).mkdir(parents=True, exist_ok=True)
+    prepared = f"{PREPARED_DIR}/{source_hash(source)[:16]}.mp4"
+    if Path(prepared).is_file():
+        return prepared
+
+    print_step("Preparing the background video, this is only done once per video 🎞️")
+    _, input_args, output_args, threads = get_encoder_profile()
+    start = time.perf_counter()
+    video = format_background(ffmpeg.input(source, an=None, **input_args))
+    part = temp_path(prepared, ".mp4")  # another process may be preparing the same video
+    try:
+        (
+            video.output(
+                part,
+                force_key_frames=f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+                movflags="+faststart",
+                threads=threads,
+                **output_args,
+            )
+            .overwrite_output()
+            .run(quiet=True)
+        )
+        os.replace(part, prepared)
+    except BaseException:
+        Path(part).unlink(missing_ok=True)
+        raise
+    print_substep(f"Background prepared in {time.perf_counter() - start:.0f}s", style="bold green")
+    return prepared
+
+
+def chop_background_video(
+    background_config: Tuple[str, str, str, Any],
+    video_length: int,
+    reddit_object: dict,
+    source: str = None,
+) -> Tuple[str, float, float]:
+    """Generates the background footage to be used in the video and writes it to background.mp4 in the job directory
+
+    With the direct_seek setting nothing is written, the renderer seeks into the source instead.
 
     Args:
         background_config (Tuple[str, str, str, Any]) : Current background configuration
         video_length (int): Length of the clip where the background footage is to be taken out of
+        source (Optional): Video to cut from, see prepare_background. Defaults to the downloaded video
+
+    Returns:
+        Tuple[str, float, float]: Path, start and duration of the footage for the renderer
     """
 
     print_step("Finding a spot in the backgrounds video to chop...✂️")
     choice = f"{background_config[2]}-{background_config[1]}"
+    source = source or f"assets/backgrounds/{choice}"
     id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
-    background = VideoFileClip(f"assets/backgrounds/{choice}")
+    entry = get_entry(source)
 
-    start_time, end_time = get_start_and_end_times(video_length, background.duration)
-    try:
-        ffmpeg_extract_subclip(
-            f"assets/backgrounds/{choice}",
-            start_time,
-            end_time,
-            targetname=f"assets/temp/{id}/background.mp4",
-        )
-    except (OSError, IOError):  # ffmpeg issue see #348
-        print_substep("FFMPEG issue. Trying again...")
-        with VideoFileClip(f"assets/backgrounds/{choice}") as video:
-            new = video.subclip(start_time, end_time)
-            new.write_videofile(f"assets/temp/{id}/background.mp4", threads=10)
+    start_time, end_time = get_start_and_end_times(
+        video_length, entry["duration"], entry["keyframes"]
+    )
+    if settings.config["settings"]["background"]["direct_seek"]:
+        print_substep(f"The video will seek to {start_time:.1f}s of the background, nothing to chop")
+        return source, start_time, end_time - start_time
+
+    background = ffmpeg.input(source, ss=start_time, t=end_time - start_time, an=None)
+    output = f"{job_dir(id)}/background.mp4"
+    if start_time in entry["keyframes"]:
+        # starts on a keyframe, so copying the packets gives exactly this interval
+        background = background.output(output, c="copy", avoid_negative_ts="make_zero")
+    else:
+        print_substep("No keyframe in range, re-encoding the background clip...")
+        _, _, output_args, threads = get_encoder_profile()
+        background = background.output(output, threads=threads, **output_args)
+    background.overwrite_output().run(quiet=True)
     print_substep("Background video chopped successfully!", style="bold green")
-    return background_config[2]
+    return output, 0, end_time - start_time
@@ -0,0 +1,207 @@
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils import settings
+from utils.console import print_step, print_substep
+from utils.translate import get_languages, translate_text
+from utils.workdir import job_dir
+
+WIDTH = 960  # the width the final video scales the cards to
+PADDING = 36
+RADIUS = 20
+THEMES = {
+    "dark": {"background": (26, 26, 27, 255), "text": (215, 218, 220), "meta": (129, 131, 132)},
+    "light": {"background": (255, 255, 255, 255), "text": (28, 28, 28), "meta": (120, 124, 126)},
+}
+# tried in order when the font setting is empty, Pillow also looks in the system font folders
+FONTS = ["arial.ttf", "Arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Helvetica.ttc"]
+BOLD_FONTS = ["arialbd.ttf", "Arial Bold.ttf", "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf"]
+SIZES = {"meta": 24, "title": 40, "body": 32}
+
+Card = Tuple[str, str, str, str, str]  # meta line, heading, body, footer, path
+
+
+def render_cards(reddit_object: dict, screenshot_num: int):
+    """Draws the title and comment cards of the thread with Pillow, instead of screenshots.
+
+    The cards get the same names in the png folder of the job directory as the screenshots, and
+    the theme setting decides their colours. They are drawn in worker processes.
+
+    Args:
+        reddit_object (Dict): Reddit object received from reddit/subreddit.py
+        screenshot_num (int): Number of comment cards to draw
+    """
+    print_step("Drawing the cards of the thread...")
+    id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
+    path = f"{job_dir(id)}/png"
+    Path(path).mkdir(parents=True, exist_ok=True)
+
+    languages = get_languages()
+    meta = f"r/{reddit_object['thread_subreddit']} • Posted by u/{reddit_object['thread_author']}"
+    cards: List[Card] = []
+    for lang in languages:
+        # a multi-language run gets a title card per language
+        suffix = f"_{lang}" if len(languages) > 1 else ""
+        title = translate_text(reddit_object["thread_title"], lang)
+        footer = (
+            f"{format_score(reddit_object['thread_score'])} points • "
+            f"{format_score(reddit_object['thread_num_comments'])} comments"
+        )
+        cards.append((meta, title, "", footer, f"{path}/title{suffix}.png"))
+    for idx, comment in enumerate(reddit_object["comments"][:screenshot_num]):
+        meta = f"u/{comment['comment_author']} • {format_score(comment['comment_score'])} points"
+        cards.append((meta, "", comment["comment_body"], "", f"{path}/comment_{idx}.png"))
+
+    style = (
+        settings.config["settings"]["theme"] or "dark",
+        str(settings.config["settings"]["screenshots"]["font"] or ""),
+    )
+    workers = min(multiprocessing.cpu_count(), len(cards))
+    chunks = [cards[i::workers] for i in range(workers)]  # mixes long and short comments
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_draw_cards, chunks, [style] * workers))
+    print_substep(f"Drew {len(cards)} cards on {workers} processes.", style="bold green")
+
+
+def format_score(score: int) -> str:
+    """Shortens a score the way reddit does, 12345 is 12.3k and 1234567 is 1.2m"""
+    score = int(score or 0)
+    if abs(score) < 1000:
+        return str(score)
+    for unit, size in (("k", 1000), ("m", 1000**2)):
+        # the unit is picked from the rounded text, so 99999 is 100k and 999999 is 1.0m
+        for decimals, limit in ((1, 100), (0, 1000)):
+            text = f"{score / size:.{decimals}f}"
+            if abs(float(text)) < limit or unit == "m" and decimals == 0:
+                return f"{text}{unit}"
+
+
+def _draw_cards(cards: List[Card], style: Tuple[str, str]):
+    """Draws and saves every card, in a worker process"""
+    for card in cards:
+        draw_card(*card, *style)
+
+
+def draw_card(
+    meta: str, heading: str, body: str, footer: str, path: str, theme: str = "dark", font: str = ""
+):
+    """Draws a card of the meta line, heading, body and footer, leaving out the empty ones.
+
+    Args:
+        meta (str): Line above the text, like the author and score
+        heading (str): Text in bold, the title of a thread
+        body (str): Text of a comment
+        footer (str): Line below the text
+        path (str): Path to save the card to
+        theme (Optional): "dark" or "light"
+        font (Optional): Path of a TrueType font, a system font is looked up if empty
+    """
+    colours = THEMES.get(theme, THEMES["dark"])
+    blocks = [
+        (get_font(font, SIZES[size], bold), colours[colour], wrap(text, font, size, bold))
+        for text, size, bold, colour in (
+            (meta, "meta", False, "meta"),
+            (heading, "title", True, "text"),
+            (body, "body", False, "text"),
+            (footer, "meta", False, "meta"),
+        )
+        if text
+    ]
+
+    gaps = [PADDING] + [18] * (len(blocks) - 1)
+    height = PADDING + sum(
+        gap + len(lines) * line_height(block_font)
+        for gap, (block_font, _, lines) in zip(gaps, blocks)
+    )
+    image = Image.new("RGBA", (WIDTH, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((0, 0, WIDTH - 1, height - 1), RADIUS, fill=colours["background"])
+    y = 0
+    for gap, (block_font, colour, lines) in zip(gaps, blocks):
+        y += gap
+        for line in lines:
+            draw.text((PADDING, y), line, font=block_font, fill=colour)
+            y += line_height(block_font)
+    image.save(path)
+
+
+@lru_cache(maxsize=None)
+def get_font(font: str, size: int, bold: bool):
+    """Loads a font once per process, the font setting first, then the first system font found"""
+    candidates = ([font] if font else []) + (BOLD_FONTS if bold else []) + FONTS
+    for candidate in candidates:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    raise OSError("No TrueType font found, set settings.screenshots.font to the path of one")
+
+
+@lru_cache(maxsize=None)
+def line_height(font) -> int:
+    ascent, descent = font.getmetrics()
+    return round((ascent + descent) * 1.25)
+
+
+_advances: Dict[Tuple[int, str], float] = {}
+
+
+def text_width(text: str, font) -> float:
+    """Width of the text from the cached advance of each glyph, without kerning"""
+    width = 0.0
+    for char in text:
+        advance = _advances.get((id(font), char))
+        if advance is None:
+            advance = _advances[(id(font), char)] = font.getlength(char)
+        width += advance
+    return width
+
+
+def wrap(text: str, font: str, size: str, bold: bool = False) -> List[str]:
+    """Splits the text into lines that fit the card, keeping its own line breaks.
+
+    Args:
+        text (str): Text to wrap
+        font (str): Font setting
+        size (str): Key of SIZES
+        bold (Optional): Whether the bold font is used
+
+    Returns:
+        List[str]: The lines
+    """
+    loaded = get_font(font, SIZES[size], bold)
+    width = WIDTH - 2 * PADDING
+    space = text_width(" ", loaded)
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line, line_width = [], 0.0
+        for word in paragraph.split():
+            word_width = text_width(word, loaded)
+            if word_width > width:  # longer than a line, like a link, broken at any character
+                if line:
+                    line.append(" ")
+                    line_width += space
+                for char in word:
+                    char_width = text_width(char, loaded)
+                    if line and line_width + char_width > width:
+                        lines.append("".join(line))
+                        line, line_width = [], 0.0
+                    line.append(char)
+                    line_width += char_width
+                continue
+            needed = word_width + (space if line else 0)
+            if line and line_width + needed > width:
+                lines.append("".join(line))
+                line, line_width, needed = [], 0.0, word_width
+            line.append((" " if line else "") + word)
+            line_width += needed
+        lines.append("".join(line))
+    while len(lines) > 1 and not lines[-1]:
+        lines.pop()
+    return lines
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
+import math
 import multiprocessing
-import os
 import re
 import shutil
-from mutagen.mp3 import MP3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
 from os.path import exists
-from typing import Tuple, Any
+from pathlib import Path
+from typing import List, Tuple, Any
 from moviepy.audio.AudioClip import concatenate_audioclips, CompositeAudioClip
 from moviepy.audio.io.AudioFileClip import AudioFileClip
 from moviepy.video.VideoClip import ImageClip
@@ -13,30 +16,28 @@ from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
 from moviepy.video.compositing.concatenate import concatenate_videoclips
 from moviepy.video.io.VideoFileClip import VideoFileClip
 from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
+from PIL import Image
 from rich.console import Console
 
+from utils.audio import get_duration, load_manifest
 from utils.cleanup import cleanup
 from utils.console import print_step, print_substep
+from utils.encoder import get_encoder_profile
+from utils.translate import translate_text
+from utils.workdir import job_dir
 from utils.video import Video
 from utils.videos import save_data
 from utils import settings
 import ffmpeg
+
 console = Console()
 W, H = 1080, 1920
 
-input_args = {
-    "hwaccel": "cuda",
-    # todo hwaccel codec
-}
-
-output_args = {
-    "c:v": "hevc_nvenc",
-    "preset": "fast",
-    "tier": "high",
-    "b:v": "20M",
-}
 
-def name_normalize(name: str) -> str:
+def name_normalize(name: str, lang: str = None) -> str:
+    # translated as it is, that is how translate_thread cached it along with the rest of the thread
+    name = translate_text(name, lang)
+    name = re.sub(r"[^\w\s-]", "", name)
     name = re.sub(r'[?\\"%*:|<>]', "", name)
     name = re.sub(r"( [w,W]\s?\/\s?[o,O,0])", r" without", name)
     name = re.sub(r"( [w,W]\s?\/)", r" with", name)
@@ -44,17 +45,349 @@ def name_normalize(name: str) -> str:
     name = re.sub(r"(\w+)\s?\/\s?(\w+)", r"\1 or \2", name)
     name = re.sub(r"\/", r"", name)
     name[:30]
+    return name
 
-    lang = settings.config["reddit"]["thread"]["post_lang"]
-    if lang:
-        import translators as ts
 
-        print_substep("Translating filename...")
-        translated_name = ts.google(name, to_language=lang)
-        return translated_name
+def format_background(background, formatted: bool = False):
+    """Scales the background to the video height and crops it to the video width.
 
-    else:
-        return name
+    Args:
+        background: The background video stream
+        formatted (Optional): Whether the background already is W x H, it is left as is then
+    """
+    if formatted:
+        return background
+    background = ffmpeg.filter(background, "scale", -2, H)
+    return ffmpeg.crop(background, 1200, 0, W, H)
+
+
+def is_formatted(path: str) -> bool:
+    """Whether the video is W x H already, like the backgrounds cut from a prepared background"""
+    video = next(s for s in ffmpeg.probe(path)["streams"] if s["codec_type"] == "video")
+    return (int(video["width"]), int(video["height"])) == (W, H)
+
+
+def open_background(background: Tuple[str, float, float], input_args: dict):
+    """Opens the interval of the background the video uses, seeking before decoding.
+
+    Args:
+        background (Tuple[str, float, float]): Path, start and duration of the interval, either
+            the chopped background.mp4 or the source background when seeking into it directly
+        input_args (dict): ffmpeg input args of the encoder profile
+    """
+    path, start, duration = background
+    return ffmpeg.input(path, ss=start, t=duration, an=None, **input_args)
+
+
+def render_segment(
+    background: str,
+    start: float,
+    duration: float,
+    image: str,
+    audio: str,
+    length: float,
+    encoder: Tuple[dict, dict, int],
+    output: str,
+    formatted: bool = False,
+) -> str:
+    """Renders one comment (background slice, screenshot and audio clip) to its own file.
+
+    Args:
+        background (str): Path of the chopped background video
+        start (float): Where the segment starts in the background, in seconds
+        duration (float): Duration of the segment, a whole number of frames
+        image (str): Path of the screenshot shown during the segment
+        audio (str): Path of the audio clip of the segment
+        length (float): Duration of the audio clip, the screenshot is hidden after it
+        encoder (Tuple[dict, dict, int]): ffmpeg input args, output args and threads
+        output (str): Path to write the segment to
+        formatted (Optional): Whether the background is W x H already
+
+    Returns:
+        str: The path of the rendered segment
+    """
+    input_args, output_args, threads = encoder
+    bgv = ffmpeg.input(background, ss=start, t=duration, an=None, **input_args)
+    bgv = format_background(bgv, formatted)
+    comm = ffmpeg.filter(ffmpeg.input(image), "scale", 960, -2)
+    bgv = ffmpeg.filter(
+        [bgv, comm], "overlay", "(W-w)/2", "(H-h)/2", enable=f"between(t,0,{str(length)})"
+    )
+    # pad the clip with silence so the audio ends exactly where the video does
+    tts = ffmpeg.filter(ffmpeg.input(audio), "apad")
+    (
+        ffmpeg.output(bgv, tts, output, t=duration, threads=threads, **output_args)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return output
+
+
+def render_parallel(
+    path: str,
+    image_clips: List[str],
+    audio_clips: List[str],
+    lengths: List[float],
+    encoder: Tuple[dict, dict, int],
+    background: Tuple[str, float, float],
+):
+    """Renders the video in segments split at the comment boundaries, one process per segment.
+
+    The boundaries are snapped to the frame grid of the background so the segments can be joined
+    with the concat demuxer without re-encoding. If the audio of the joined video drifts more than
+    one frame from the video, the audio track is re-encoded in one pass.
+
+    Args:
+        path (str): The temporary folder of the thread, the result is written to almost.mp4
+        image_clips (List[str]): Paths of the screenshots, in playback order
+        audio_clips (List[str]): Paths of the audio clips, in playback order
+        lengths (List[float]): Duration of each audio clip
+        encoder (Tuple[dict, dict, int]): ffmpeg input args, output args and threads
+        background (Tuple[str, float, float]): Path, start and duration of the background interval
+    """
+    input_args, output_args, threads = encoder
+    background, offset, duration = background
+    video = next(s for s in ffmpeg.probe(background)["streams"] if s["codec_type"] == "video")
+    fps = Fraction(video["r_frame_rate"])
+    formatted = (int(video["width"]), int(video["height"])) == (W, H)
+    total_frames = round(duration * fps)
+
+    boundaries, now = [0], 0
+    for length in lengths:
+        now += length
+        boundaries.append(round(now * fps))
+    boundaries[-1] = max(boundaries[-1], total_frames)  # the last card keeps the background tail
+
+    workers = min(len(image_clips), multiprocessing.cpu_count())
+    encoder = (input_args, output_args, max(1, threads // workers))
+    print_substep(f"Rendering {len(image_clips)} segments on {workers} processes...")
+    Path(f"{path}/segments").mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                render_segment,
+                background,
+                offset + float(boundaries[i] / fps),
+                float((boundaries[i + 1] - boundaries[i]) / fps),
+                image_clips[i],
+                audio_clips[i],
+                lengths[i],
+                encoder,
+                f"{path}/segments/{i}.mp4",
+                formatted,
+            )
+            for i in range(len(image_clips))
+        ]
+        segments = [future.result() for future in futures]
+
+    with open(f"{path}/segments/segments.txt", "w", encoding="utf-8") as f:
+        f.writelines(f"file '{Path(segment).name}'\n" for segment in segments)
+    (
+        ffmpeg.input(f"{path}/segments/segments.txt", f="concat", safe=0)
+        .output(f"{path}/almost.mp4", c="copy")
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+    durations = {
+        stream["codec_type"]: float(stream["duration"])
+        for stream in ffmpeg.probe(f"{path}/almost.mp4")["streams"]
+    }
+    drift = abs(durations["audio"] - durations["video"])
+    if drift <= 1 / fps:
+        print_substep(f"Audio drift is {drift * 1000:.1f} ms, within one frame.")
+        return
+    print_substep(
+        f"Audio drift is {drift * 1000:.1f} ms, re-encoding the audio track in one pass...",
+        style="red",
+    )
+    audio = ffmpeg.concat(*[ffmpeg.input(clip) for clip in audio_clips], v=0, a=1)
+    audio = ffmpeg.filter(audio, "apad")
+    shutil.move(f"{path}/almost.mp4", f"{path}/segments/joined.mp4")
+    (
+        ffmpeg.output(
+            ffmpeg.input(f"{path}/segments/joined.mp4").video,
+            audio,
+            f"{path}/almost.mp4",
+            t=float(boundaries[-1] / fps),
+            vcodec="copy",
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def chain_overlays(background, image_clips: List[str], lengths: List[float], input_args: dict):
+    """Overlays every screenshot on the background with its own overlay filter, enabled while its audio clip plays.
+
+    Args:
+        background: The background video stream
+        image_clips (List[str]): Paths of the screenshots, in playback order
+        lengths (List[float]): Duration of the audio clip belonging to each screenshot
+        input_args (dict): ffmpeg input args of the encoder profile
+
+    Returns:
+        The background stream with all overlays chained onto it
+    """
+    now = 0
+    for image, length in zip(image_clips, lengths):
+        comm = ffmpeg.input(image, **input_args)
+        comm = ffmpeg.filter(comm, "scale", 960, -2)
+        background = ffmpeg.filter(
+            [background, comm],
+            "overlay",
+            "(W-w)/2",
+            "(H-h)/2",
+            enable=f"between(t,{str(now)},{str(now + length)})",
+        )
+        now += length
+    return background
+
+
+def build_overlay_track(image_clips: List[str], lengths: List[float], path: str):
+    """Pre-sequences the screenshots into a single overlay stream.
+
+    Each screenshot is scaled to 960 wide and centred on a transparent W x H canvas, the same
+    placement chain_overlays gives it, and the canvases are listed in an ffconcat file with the
+    duration of their audio clip. The background then needs exactly one overlay filter.
+
+    Args:
+        image_clips (List[str]): Paths of the screenshots, in playback order
+        lengths (List[float]): Duration of the audio clip belonging to each screenshot
+        path (str): Folder to write the canvases and the concat list to
+
+    Returns:
+        The overlay track as an ffmpeg input stream
+    """
+    Path(path).mkdir(parents=True, exist_ok=True)
+    concat_list = ["ffconcat version 1.0"]
+    for idx, (image, length) in enumerate(zip(image_clips, lengths)):
+        with Image.open(image) as screenshot:
+            height = round(screenshot.height * 960 / screenshot.width / 2) * 2
+            card = screenshot.convert("RGBA").resize((960, height), Image.LANCZOS)
+        canvas = Image.new("RGBA", (W, H), (0, 0, 0, 0))
+        canvas.paste(card, ((W - card.width) // 2, (H - card.height) // 2))
+        canvas.save(f"{path}/{idx}.png")
+        concat_list += [f"file '{idx}.png'", f"duration {length:.6f}"]
+    # the concat demuxer ignores the duration of the last entry unless it is listed twice
+    concat_list.append(f"file '{len(image_clips) - 1}.png'")
+    with open(f"{path}/overlay.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(concat_list) + "\n")
+    return ffmpeg.input(f"{path}/overlay.txt", f="concat", safe=0)
+
+
+def report_render_speed(video: str, seconds: float, overlay_nodes: int):
+    """Prints how long the render took per frame of the finished video.
+
+    Args:
+        video (str): Path of the rendered video
+        seconds (float): Wall-clock time the render took
+        overlay_nodes (int): Number of overlay filters in the filtergraph
+    """
+    stream = next(s for s in ffmpeg.probe(video)["streams"] if s["codec_type"] == "video")
+    frames = int(stream.get("nb_frames", 0)) or 1
+    print_substep(
+        f"Rendered {frames} frames in {seconds:.1f}s ({seconds / frames * 1000:.2f} ms per frame) "
+        f"with {overlay_nodes} overlay filter(s)",
+        style="bold blue",
+    )
+
+
+def gather_clips(
+    id: str, number_of_clips: int, lang: str = None
+) -> Tuple[List[str], List[str], List[float]]:
+    """Lists the screenshots and audio clips of the video in playback order, with the clip lengths.
+
+    Comments without a screenshot, because they couldn't be found on reddit, are left out along
+    with their audio clip.
+
+    Args:
+        id (str): The sanitized thread id
+        number_of_clips (int): Number of comments that were synthesized
+        lang (Optional): Language of a multi-language run, which has its own title and audio clips
+
+    Returns:
+        Tuple[List[str], List[str], List[float]]: Screenshots, audio clips and their lengths
+    """
+    mp3 = f"{job_dir(id)}/{lang}/mp3" if lang else f"{job_dir(id)}/mp3"
+    title = f"title_{lang}" if lang else "title"
+    comments = [i for i in range(number_of_clips) if exists(f"{job_dir(id)}/png/comment_{i}.png")]
+    if len(comments) < number_of_clips:
+        skipped = sorted(set(range(number_of_clips)) - set(comments))
+        print_substep(
+            f"Leaving out {len(skipped)} comments without a screenshot: "
+            f"{', '.join(map(str, skipped))}",
+            style="bold red",
+        )
+    audio_clips = [f"{mp3}/title.mp3"] + [f"{mp3}/{i}.mp3" for i in comments]
+    image_clips = [f"{job_dir(id)}/png/{title}.png"]
+    image_clips += [f"{job_dir(id)}/png/comment_{i}.png" for i in comments]
+    # the lengths were recorded while the clips were synthesized
+    manifest = load_manifest(mp3)
+    lengths = [manifest.get(Path(clip).stem) or get_duration(clip) for clip in audio_clips]
+    return image_clips, audio_clips, lengths
+
+
+def make_renditions(
+    renditions: List[Tuple[str, int, int]],
+    reddit_obj: dict,
+    background_config: Tuple[str, str, str, Any],
+    background: Tuple[str, float, float] = None,
+):
+    """Renders a video per language from one decode of the background.
+
+    The background is decoded and scaled once, and split into a branch per language that gets
+    the screenshots and audio of that language. All videos are encoded by the same ffmpeg run.
+
+    Args:
+        renditions (List[Tuple[str, int, int]]): Language, comment count and length of each video
+        reddit_obj (dict): The reddit object that contains the posts to read.
+        background_config (Tuple[str, str, str, Any]): The background config to use.
+        background (Optional): Path, start and duration of the background interval, as planned
+            by chop_background_video. Defaults to the chopped background.mp4
+    """
+    id = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
+    print_step(f"Creating the final videos in {len(renditions)} languages 🎥")
+    _, input_args, output_args, threads = get_encoder_profile()
+
+    longest = max(length for _, _, length in renditions)
+    background = background or (f"{job_dir(id)}/background.mp4", 0, longest)
+    bgv = open_background(background, input_args)
+    branches = format_background(bgv, is_formatted(background[0])).split()
+    outputs = []
+    for idx, (lang, number_of_clips, length) in enumerate(renditions):
+        image_clips, audio_clips, lengths = gather_clips(id, number_of_clips, lang)
+        if len(image_clips) <= number_of_clips:  # comments were left out
+            length = math.ceil(sum(lengths))
+        console.log(f"[bold green] The {lang} video will be: {length} Seconds Long")
+        video = branches[idx]
+        if settings.config["settings"]["render"]["overlay_mode"] == "chained":
+            video = chain_overlays(video, image_clips, lengths, input_args)
+        else:
+            track = build_overlay_track(image_clips, lengths, f"{job_dir(id)}/{lang}/overlay")
+            video = ffmpeg.filter([video, track], "overlay", 0, 0, eof_action="pass")
+        audio = ffmpeg.concat(*[ffmpeg.input(aud, **input_args) for aud in audio_clips], v=0, a=1)
+        output = f"{job_dir(id)}/{lang}/almost.mp4"
+        outputs.append(ffmpeg.output(video, audio, output, t=length, threads=threads, **output_args))
+
+    render_start = time.perf_counter()
+    ffmpeg.merge_outputs(*outputs).global_args("-y").run(cmd="ffpb")
+    print_substep(
+        f"Rendered {len(renditions)} videos in {time.perf_counter() - render_start:.1f}s "
+        "from one decode of the background",
+        style="bold blue",
+    )
+
+    subreddit = settings.config["reddit"]["thread"]["subreddit"]
+    title = re.sub(r"[^\w\s-]", "", reddit_obj["thread_title"])
+    for lang, _, _ in renditions:
+        # moved, not renamed, temp_root may be on another filesystem. If it fails the job
+        # directory is left as it is, it still holds the videos
+        shutil.move(f"{job_dir(id)}/{lang}/almost.mp4", f"results/{id}_{lang}.mp4")
+    # the thread is done once, under the name of its first language
+    filename = f"{name_normalize(reddit_obj['thread_title'], renditions[0][0])[:251]}.mp4"
+    save_data(subreddit, filename, title, id, background_config[2])
+    cleanup(id)
 
 
 def make_final_video(
@@ -62,13 +395,15 @@ def make_final_video(
     length: int,
     reddit_obj: dict,
     background_config: Tuple[str, str, str, Any],
+    background: Tuple[str, float, float] = None,
 ):
-    """Gathers audio clips, gathers all screenshots, stitches them together and saves the final video to assets/temp
+    """Gathers audio clips, gathers all screenshots, stitches them together and saves the final video to results
     Args:
         number_of_clips (int): Index to end at when going through the screenshots'
         length (int): Length of the video
         reddit_obj (dict): The reddit object that contains the posts to read.
         background_config (Tuple[str, str, str, Any]): The background config to use.
+        background (Optional): Path, start and duration of the background interval, as planned by chop_background_video. Defaults to the chopped background.mp4
     """
     # try:  # if it isn't found (i.e you just updated and copied over config.toml) it will throw an error
     #    VOLUME_MULTIPLIER = settings.config["settings"]['background']["background_audio_volume"]
@@ -79,66 +414,56 @@ def make_final_video(
     print_step("Creating the final video 🎥")
     opacity = settings.config["settings"]["opacity"]
     transition = settings.config["settings"]["transition"]
+    _, input_args, output_args, threads = get_encoder_profile()
     """background_clip = (
-        VideoFileClip(f"assets/temp/{id}/background.mp4")
+        VideoFileClip(f"{job_dir(id)}/background.mp4")
         .without_audio()
         .resize(height=H)
         .crop(x1=1166.6, y1=0, x2=2246.6, y2=1920)
     )"""
-    bgv = ffmpeg.input(f"assets/temp/{id}/background.mp4", an=None, **input_args)
-    bgv = ffmpeg.filter(bgv, "scale", -2, 1920)
-    bgv = ffmpeg.crop(bgv, 1200, 0, 1080, 1920)
-
-
-    # Gather all audio clips
-    audio_clips = [f"assets/temp/{id}/mp3/{i}.mp3" for i in range(number_of_clips)]
-    audio_clips.insert(0, f"assets/temp/{id}/mp3/title.mp3")
 
+    image_clips, audio_clips, lengths = gather_clips(id, number_of_clips)
+    if len(image_clips) <= number_of_clips:  # comments were left out
+        length = math.ceil(sum(lengths))
     console.log(f"[bold green] Video Will Be: {length} Seconds Long")
-    # add title to video
-    image_clips = []
-    # Gather all images
-    image_clips.insert(
-        0,
-        f"assets/temp/{id}/png/title.png"
-    )
+    path, start, _ = background or (f"{job_dir(id)}/background.mp4", 0, length)
+    background = (path, start, length)
 
-    for i in range(0, number_of_clips):
-        image_clips.append(
-            f"assets/temp/{id}/png/comment_{i}.png"
+    render_start = time.perf_counter()
+    if settings.config["settings"]["render"]["parallel"]:
+        render_parallel(
+            f"{job_dir(id)}",
+            image_clips,
+            audio_clips,
+            lengths,
+            (input_args, output_args, threads),
+            background,
         )
-    
-    lengths = []
-    for i in audio_clips:
-        m3 = MP3(i)
-        lengths.append(m3.info.length)
-        
-
-
-    now = 0
-    ttss = []
-    for i in range(len(image_clips)):
-        ii = i
-        nextnow = lengths[ii] + now
-        ima = image_clips[ii]
-        aud = audio_clips[ii]
-        tts = ffmpeg.input(aud, **input_args)
-        ttss.append(tts)
-        comm = ffmpeg.input(ima, **input_args)
-        comm = ffmpeg.filter(comm, "scale", 960, -2)
-        bgv = ffmpeg.filter([bgv, comm], "overlay", "(W-w)/2", "(H-h)/2", enable=f"between(t,{str(now)},{str(nextnow)})")
-        print(ima, now, nextnow, ii)
-        now = nextnow
-    audio = ffmpeg.concat(*ttss, v=0, a=1)
-    ot = ffmpeg.output(bgv, audio,  f"assets/temp/{id}/almost.mp4", **output_args).global_args("-threads", "12", "-y")
-    print(ot.get_args())
-    
-    ot.run(cmd="ffpb")
-    try:
-        os.rename(f"assets/temp/{id}/almost.mp4", f"results/{id}.mp4")
-    except Exception as e:
-        console.log(e)
-    shutil.rmtree("assets/temp/")
+        overlay_nodes = 1
+    else:
+        bgv = open_background(background, input_args)
+        bgv = format_background(bgv, is_formatted(background[0]))
+        ttss = [ffmpeg.input(aud, **input_args) for aud in audio_clips]
+        if settings.config["settings"]["render"]["overlay_mode"] == "chained":
+            bgv = chain_overlays(bgv, image_clips, lengths, input_args)
+            overlay_nodes = len(image_clips)
+        else:
+            track = build_overlay_track(image_clips, lengths, f"{job_dir(id)}/overlay")
+            bgv = ffmpeg.filter([bgv, track], "overlay", 0, 0, eof_action="pass")
+            overlay_nodes = 1
+        audio = ffmpeg.concat(*ttss, v=0, a=1)
+        ot = ffmpeg.output(
+            bgv, audio, f"{job_dir(id)}/almost.mp4", threads=threads, **output_args
+        ).global_args("-y")
+        print(ot.get_args())
+        ot.run(cmd="ffpb")
+    report_render_speed(
+        f"{job_dir(id)}/almost.mp4", time.perf_counter() - render_start, overlay_nodes
+    )
+    # moved, not renamed, temp_root may be on another filesystem. If it fails the job directory
+    # is left as it is, it still holds the video
+    shutil.move(f"{job_dir(id)}/almost.mp4", f"results/{id}.mp4")
+    cleanup(id)
     # if os.path.exists("assets/mp3/posttext.mp3"):
     #    image_clips.insert(
     #        0,
@@ -172,7 +497,7 @@ def make_final_video(
     #    final.set_audio(final_audio)
 
     final.write_videofile(
-        f"assets/temp/{id}/temp.mp4",
+        f"{job_dir(id)}/temp.mp4",
         fps=24,
         audio_codec="aac",
         audio_bitrate="192k",
@@ -180,17 +505,17 @@ def make_final_video(
         threads=10
     )
     ffmpeg_extract_subclip(
-        f"assets/temp/{id}/temp.mp4",
+        f"{job_dir(id)}/temp.mp4",
         0,
         length,
         targetname=f"results/{subreddit}/{filename}",
     )"""
     subreddit = settings.config["reddit"]["thread"]["subreddit"]
     title = re.sub(r"[^\w\s-]", "", reddit_obj["thread_title"])
-    filename = f"{name_normalize(title)[:251]}.mp4"
+    filename = f"{name_normalize(reddit_obj['thread_title'])[:251]}.mp4"
     idx = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
     save_data(subreddit, filename, title, idx, background_config[2])
-    
+
     """
     print_step("Removing temporary files 🗑")
     cleanups = cleanup(id)
@@ -200,4 +525,4 @@ def make_final_video(
     print_step(
         f'Reddit title: {reddit_obj["thread_title"]} \n Background Credit: {background_config[2]}'
     )
-"""
\ No newline at end of file
+"""
@@ -1,8 +1,6 @@
-import json
-
 from pathlib import Path
 import re
-from typing import Dict
+from typing import Dict, List, Tuple
 
 from numpy import False_
 from utils import settings
@@ -10,17 +8,45 @@ from playwright.async_api import async_playwright  # pylint: disable=unused-impo
 
 # do not remove the above line
 
-from playwright.sync_api import sync_playwright, ViewportSize
-from rich.progress import track
-import translators as ts
+import asyncio
+import io
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+from playwright.async_api import Error
 
+from utils.browser import browser_pool, close_browser_pool
 from utils.console import print_step, print_substep
+from utils.translate import get_languages, translate_text
+from utils.workdir import job_dir
 
 storymode = False
 
+MAX_SHOT_HEIGHT = 8000  # pixels, Chromium can't take screenshots much taller than 16384
+MIN_CROPS_PER_WORKER = 4  # every worker decodes the whole screenshot, so give it a few cards
+
+# page coordinates of the element of each selector, null for elements that aren't shown
+BOXES_SCRIPT = """selectors => ({
+    ratio: window.devicePixelRatio,
+    boxes: selectors.map(selector => {
+        const element = document.querySelector(selector);
+        const rect = element && element.getBoundingClientRect();
+        if (!rect || !rect.width || !rect.height) return null;
+        return {
+            x: rect.left + window.scrollX,
+            y: rect.top + window.scrollY,
+            width: rect.width,
+            height: rect.height,
+        };
+    }),
+})"""
+
 
 def download_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
-    """Downloads screenshots of reddit posts as seen on the web. Downloads to assets/temp/png
+    """Downloads screenshots of reddit posts as seen on the web. Downloads to the png folder of the job directory
 
     Args:
         reddit_object (Dict): Reddit object received from reddit/subreddit.py
@@ -29,90 +55,263 @@ def download_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: in
     print_step("Downloading screenshots of reddit posts...")
     id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
     # ! Make sure the reddit screenshots folder exists
-    Path(f"assets/temp/{id}/png").mkdir(parents=True, exist_ok=True)
+    Path(f"{job_dir(id)}/png").mkdir(parents=True, exist_ok=True)
 
-    with sync_playwright() as p:
-        print_substep("Launching Headless Browser...")
+    ready = browser_pool().run(_take_screenshots, reddit_object, screenshot_num, id)
+    browser_pool().network.report(ready)
+    print_substep("Screenshots downloaded Successfully.", style="bold green")
 
-        browser = p.chromium.launch()
-        context = browser.new_context()
 
-        if settings.config["settings"]["theme"] == "dark":
-            cookie_file = open("./video_creation/data/cookie-dark-mode.json", encoding="utf-8")
-        else:
-            cookie_file = open("./video_creation/data/cookie-light-mode.json", encoding="utf-8")
-        cookies = json.load(cookie_file)
-        context.add_cookies(cookies)  # load preference cookies
-        # Get the thread screenshot
-        page = context.new_page()
-        page.goto(reddit_object["thread_url"], timeout=0)
-        page.set_viewport_size(ViewportSize(width=1920, height=1080))
-        if page.locator('[data-testid="content-gate"]').is_visible():
-            # This means the post is NSFW and requires to click the proceed button.
-
-            print_substep("Post is NSFW. You are spicy...")
-            page.locator('[data-testid="content-gate"] button').click()
-            page.wait_for_load_state()  # Wait for page to fully load
-
-            if page.locator('[data-click-id="text"] button').is_visible():
-                page.locator(
-                    '[data-click-id="text"] button'
-                ).click()  # Remove "Click to see nsfw" Button in Screenshot
-
-        # translate code
-
-        if settings.config["reddit"]["thread"]["post_lang"]:
+async def _take_screenshots(context, reddit_object: dict, screenshot_num: int, id: str) -> float:
+    """Takes the screenshots with a browser context of the pool, on the thread of the browser.
+
+    In the locator capture mode, the comments are spread over the pages of the concurrency
+    setting, each of which opens the thread once. They are all opened at the same time as the page
+    the title is taken from. In the crop mode, the title and the comments are cropped from a few
+    tall screenshots of a single page.
+
+    Returns:
+        float: Seconds it took until the pages of the thread were ready
+    """
+    config = settings.config["settings"]["screenshots"]
+    concurrency = max(1, int(config["concurrency"] or 1))
+    crop = config["capture"] == "crop" and not storymode
+    comments = list(enumerate(reddit_object["comments"][:screenshot_num]))
+    start = time.perf_counter()
+    pages = await asyncio.gather(
+        *(
+            _open_thread(context, reddit_object["thread_url"])
+            for _ in range(1 if storymode or crop else min(concurrency, max(1, len(comments))))
+        )
+    )
+    ready = time.perf_counter() - start
+    page = pages[0]
+    crops = {}  # selector: path, for the crop mode
+
+    # translate code
+
+    languages = get_languages()
+    for lang in languages:
+        if lang:
             print_substep("Translating post...")
-            texts_in_tl = ts.google(
-                reddit_object["thread_title"],
-                to_language=settings.config["reddit"]["thread"]["post_lang"],
-            )
+            texts_in_tl = translate_text(reddit_object["thread_title"], lang)
 
-            page.evaluate(
+            await page.evaluate(
                 "tl_content => document.querySelector('[data-test-id=\"post-content\"] > div:nth-child(3) > div > div').textContent = tl_content",
                 texts_in_tl,
             )
         else:
             print_substep("Skipping translation...")
 
-        postcontentpath = f"assets/temp/{id}/png/title.png"
-        page.locator('[data-test-id="post-content"]').screenshot(path= postcontentpath)
+        # a multi-language run gets a title screenshot per language
+        suffix = f"_{lang}" if len(languages) > 1 else ""
+        postcontentpath = f"{job_dir(id)}/png/title{suffix}.png"
+        if crop and lang == languages[-1]:
+            crops['[data-test-id="post-content"]'] = postcontentpath  # the title left on the page
+            continue
+        await page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
 
-        if storymode:
-            page.locator('[data-click-id="text"]').screenshot(
-                path=f"assets/temp/{id}/png/story_content.png"
-            )
+    if storymode:
+        await page.locator('[data-click-id="text"]').screenshot(
+            path=f"{job_dir(id)}/png/story_content.png"
+        )
+    elif crop:
+        await _wait_for_comments(page, comments)
+        for idx, comment in comments:
+            crops[f"#t1_{comment['comment_id']}"] = f"{job_dir(id)}/png/comment_{idx}.png"
+        missing = await crop_screenshots(page, crops)
+        title = '[data-test-id="post-content"]'
+        if title in missing:
+            await page.locator(title).screenshot(path=crops[title])
+        comments = [c for c in comments if f"#t1_{c[1]['comment_id']}" in missing]
+        # the ones that aren't on the page are taken from their permalinks, in tabs of their own
+        await asyncio.gather(
+            *(_take_comments(context, page, comments, id) for _ in range(concurrency))
+        )
+    else:
+        # no progress bar, this runs next to the one of the TTS stage and rich only shows one
+        await asyncio.gather(*(_wait_for_comments(p, comments) for p in pages))
+        await asyncio.gather(*(_take_comments(context, p, comments, id) for p in pages))
+    for p in pages:
+        await p.close()
+    return ready
+
+
+async def crop_screenshots(page, crops: Dict[str, str]) -> List[str]:
+    """Saves the elements of the selectors from as few screenshots of the page as possible.
+
+    The boxes of all elements are read with one evaluate call. Elements that are close to each
+    other share a screenshot of up to MAX_SHOT_HEIGHT pixels, which is cropped into the cards in
+    worker processes while the next one is taken.
+
+    Args:
+        page (Page): Page the elements are on
+        crops (Dict[str, str]): Path to save the element of each selector to
+
+    Returns:
+        List[str]: The selectors of the elements that aren't shown on the page
+    """
+    found = await page.evaluate(BOXES_SCRIPT, list(crops))
+    ratio = found["ratio"]
+    boxes = [(box, path) for box, path in zip(found["boxes"], crops.values()) if box]
+    missing = [selector for selector, box in zip(crops, found["boxes"]) if not box]
+
+    bands = []  # [left, top, right, bottom, [(box, path)]], in page coordinates
+    for box, path in sorted(boxes, key=lambda b: b[0]["y"]):
+        left, top = math.floor(box["x"]), math.floor(box["y"])
+        right = math.ceil(box["x"] + box["width"])
+        bottom = math.ceil(box["y"] + box["height"])
+        if bands and bottom - bands[-1][1] <= MAX_SHOT_HEIGHT:
+            band = bands[-1]
+            band[0], band[2], band[3] = min(band[0], left), max(band[2], right), max(band[3], bottom)
+            band[4].append(((left, top, right, bottom), path))
         else:
-            for idx, comment in enumerate(
-                track(reddit_object["comments"], "Downloading screenshots...")
-            ):
-                # Stop if we have reached the screenshot_num
-                if idx >= screenshot_num:
-                    break
-
-                if page.locator('[data-testid="content-gate"]').is_visible():
-                    page.locator('[data-testid="content-gate"] button').click()
-
-                try:
-                    print('Found on page! Result!')
-                    page.locator(f"#t1_{comment['comment_id']}").screenshot(
-                        path=f"assets/temp/{id}/png/comment_{idx}.png"
-                    )
-                except:
-                    print('Could not find on page, go to seperate page.')
-                    #if comment could not be located
-                    page.goto(f'https://reddit.com{comment["comment_url"]}', timeout=0)
-
-
-
-                    try:
-                        page.locator(f"#t1_{comment['comment_id']}").screenshot(
-                            path=f"assets/temp/{id}/png/comment_{idx}.png"
-                        )
-                    except TimeoutError:
-                        del reddit_object["comments"]
-                        screenshot_num += 1
-                        print("TimeoutError: Skipping screenshot...")
-                        continue
-                    page.goto(reddit_object["thread_url"], timeout=0)
-        print_substep("Screenshots downloaded Successfully.", style="bold green")
+            bands.append([left, top, right, bottom, [((left, top, right, bottom), path)]])
+
+    loop = asyncio.get_running_loop()
+    workers = max(1, min(multiprocessing.cpu_count(), -(-len(boxes) // MIN_CROPS_PER_WORKER)))
+    futures = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for left, top, right, bottom, cards in bands:
+            png = await page.screenshot(
+                full_page=True,
+                clip={"x": left, "y": top, "width": right - left, "height": bottom - top},
+            )
+            cards = [
+                (tuple(round((v - o) * ratio) for v, o in zip(box, (left, top, left, top))), path)
+                for box, path in cards
+            ]
+            size = max(MIN_CROPS_PER_WORKER, -(-len(cards) // workers))
+            for i in range(0, len(cards), size):
+                futures.append(loop.run_in_executor(pool, _crop_cards, png, cards[i : i + size]))
+        await asyncio.gather(*futures)
+    return missing
+
+
+def _crop_cards(png: bytes, cards: List[Tuple[Tuple[int, int, int, int], str]]):
+    """Crops the (left, top, right, bottom) box of every card out of the screenshot and saves it"""
+    with Image.open(io.BytesIO(png)) as image:
+        image.load()
+        for box, path in cards:
+            image.crop(box).save(path)
+
+
+async def _open_thread(context, url: str):
+    """Opens a page of the thread and gets past the NSFW gate.
+
+    It doesn't wait for the page to finish loading, only for the post or the NSFW gate to show up,
+    within the timeout of the context.
+    """
+    page = await context.new_page()
+    await page.goto(url, wait_until="domcontentloaded")
+    await page.wait_for_selector('[data-test-id="post-content"], [data-testid="content-gate"]')
+    if await page.locator('[data-testid="content-gate"]').is_visible():
+        # This means the post is NSFW and requires to click the proceed button.
+
+        print_substep("Post is NSFW. You are spicy...")
+        await page.locator('[data-testid="content-gate"] button').click()
+        await page.wait_for_load_state()  # Wait for page to fully load
+
+        if await page.locator('[data-click-id="text"] button').is_visible():
+            await page.locator(
+                '[data-click-id="text"] button'
+            ).click()  # Remove "Click to see nsfw" Button in Screenshot
+    return page
+
+
+async def _wait_for_comments(page, comments: list):
+    """Waits, within the timeout of the context, for any of the comments to be on the page.
+
+    The page counts as ready once the post shows up, the comments are rendered after it. Counting
+    or measuring them before that would send every comment to its permalink.
+    """
+    if not comments:
+        return
+    try:
+        await page.wait_for_selector(
+            ", ".join(f"#t1_{comment['comment_id']}" for _, comment in comments), state="attached"
+        )
+    except Error:
+        pass  # not on the page at all, the comments are taken from their permalinks
+
+
+async def _take_comments(context, page, comments: list, id: str):
+    """Takes the screenshots of the comments left in the shared list, until there are none left.
+
+    Comments that aren't on the page of the thread, or can't be taken from it, are taken from
+    their permalink, in a tab of their own, so the page of the thread is never navigated away
+    from. Comments that aren't found there either get no screenshot, gather_clips leaves them out
+    of the video.
+    """
+    while comments:
+        idx, comment = comments.pop(0)
+        path = f"{job_dir(id)}/png/comment_{idx}.png"
+        locator = page.locator(f"#t1_{comment['comment_id']}")
+        try:
+            if await locator.count():
+                await locator.screenshot(path=path)
+                continue
+        except Error:
+            pass  # collapsed or detached while it was taken, tried on its permalink
+        try:
+            tab = await _open_thread(context, f'https://reddit.com{comment["comment_url"]}')
+        except Error:
+            if not context.browser.is_connected():
+                raise  # the pool restarts the browser and takes them again
+            print_substep(f"Could not open comment {idx}, leaving it out of the video...")
+            continue
+        try:
+            await tab.locator(f"#t1_{comment['comment_id']}").screenshot(path=path)
+        except Error:
+            if not context.browser.is_connected():
+                raise  # the pool restarts the browser and takes them again
+            print_substep(f"Could not find comment {idx}, leaving it out of the video...")
+        finally:
+            await tab.close()
+
+
+if __name__ == "__main__":
+    # Compares the capture time per comment of the locator and the crop mode on a saved thread page
+    import sys
+    import tempfile
+
+    if len(sys.argv) < 2:
+        sys.exit(
+            "usage: python -m video_creation.screenshot_downloader saved_thread.html [comments]"
+        )
+    url = Path(sys.argv[1]).resolve().as_uri()
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    settings.config = {
+        "settings": {
+            "theme": "dark",
+            "screenshots": {
+                "browser_endpoint": "",
+                "browser_recycle": 25,
+                "block_resources": False,  # the saved page loads its assets from disk
+                "navigation_timeout": 30,
+            },
+        }
+    }
+
+    async def benchmark(context, folder: str):
+        page = await context.new_page()
+        await page.goto(url)
+        ids = await page.evaluate(
+            "limit => [...document.querySelectorAll('[id^=t1_]')].slice(0, limit).map(e => e.id)",
+            limit,
+        )
+        start = time.perf_counter()
+        for i, comment_id in enumerate(ids):
+            await page.locator(f"#{comment_id}").screenshot(path=f"{folder}/locator_{i}.png")
+        per_locator = (time.perf_counter() - start) / len(ids)
+        start = time.perf_counter()
+        await crop_screenshots(page, {f"#{c}": f"{folder}/crop_{i}.png" for i, c in enumerate(ids)})
+        per_crop = (time.perf_counter() - start) / len(ids)
+        return len(ids), per_locator, per_crop
+
+    with tempfile.TemporaryDirectory() as folder:
+        count, per_locator, per_crop = browser_pool().run(benchmark, folder)
+        close_browser_pool()
+    print(
+        f"{count} comments, per comment: locator {per_locator * 1000:.0f} ms, crop {per_crop * 1000:.0f} ms"
+    )
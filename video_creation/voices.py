@@ -4,7 +4,8 @@ from typing import Dict, Tuple
 
 from rich.console import Console
 
-from TTS.engine_wrapper import TTSEngine
+from TTS.engine_wrapper import DEFAULT_MAX_LENGTH, TTSEngine, get_voice
+from TTS.planner import plan_comments
 from TTS.GTTS import GTTS
 from TTS.streamlabs_polly import StreamlabsPolly
 from TTS.aws_polly import AWSPolly
@@ -25,29 +26,49 @@ TTSProviders = {
 }
 
 
-def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
+def get_tts_provider():
+    """Gets the TTS module chosen in the config, asking for one if it isn't set.
+
+    Returns:
+        The class of the TTS module
+    """
+    voice = settings.config["settings"]["tts"]["voice_choice"]
+    if str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
+        return get_case_insensitive_key_value(TTSProviders, voice)
+    while True:
+        print_step("Please choose one of the following TTS providers: ")
+        print_table(TTSProviders)
+        choice = input("\n")
+        if choice.casefold() in map(lambda _: _.casefold(), TTSProviders):
+            break
+        print("Unknown Choice")
+    settings.config["settings"]["tts"]["voice_choice"] = choice  # only ask once per run
+    return get_case_insensitive_key_value(TTSProviders, choice)
+
+
+def plan_comments_to_read(reddit_obj):
+    """Replaces the comments of the reddit object with the ones that fit in the video.
+
+    Args:
+        reddit_obj (): Reddit object received from reddit API in reddit/subreddit.py
+    """
+    provider = get_tts_provider().__name__
+    reddit_obj["comments"] = plan_comments(
+        reddit_obj, provider, get_voice(provider), DEFAULT_MAX_LENGTH
+    )
+
+
+def save_text_to_mp3(reddit_obj, lang: str = None) -> Tuple[int, int]:
     """Saves text to MP3 files.
 
     Args:
         reddit_obj (): Reddit object received from reddit API in reddit/subreddit.py
+        lang (Optional): Language of a multi-language run, the files go to a folder of that name
 
     Returns:
         tuple[int,int]: (total length of the audio, the number of comments audio was generated for)
     """
-
-    voice = settings.config["settings"]["tts"]["voice_choice"]
-    if str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, voice), reddit_obj)
-    else:
-        while True:
-            print_step("Please choose one of the following TTS providers: ")
-            print_table(TTSProviders)
-            choice = input("\n")
-            if choice.casefold() in map(lambda _: _.casefold(), TTSProviders):
-                break
-            print("Unknown Choice")
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, choice), reddit_obj)
-    return text_to_mp3.run()
+    return TTSEngine(get_tts_provider(), reddit_obj, lang=lang).run()
 
 
 def get_case_insensitive_key_value(input_dict, key):